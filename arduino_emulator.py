@@ -0,0 +1,246 @@
+import os
+import sys
+import time
+import random
+import select
+import threading
+import logging
+from arduino_serial_sender import ArduinoSerialSender, BOARD_CELLS, CMD_CLEAR, CMD_SET_HEX, CMD_SET_GOAL, \
+    CMD_SET_HEXES, CMD_SET_FRAME
+
+logger = logging.getLogger(__name__)
+
+BLACK = (0, 0, 0)
+
+
+class BoardFirmwareEmulator:
+    """
+    Stand-in for the Arduino firmware of the board: parses the byte stream of ArduinoSerialSender
+    (including the bulk commands) and keeps the color of every cell.
+
+    start_pty attaches it to a pseudo-terminal (Linux only), so the sender can open the slave device as
+    if it was the Arduino serial port.
+    """
+    def __init__(self, baudrate=None):
+        """
+        :param baudrate: Reads the bytes no faster than a serial line at this rate (None for no limit).
+        """
+        self.baudrate = baudrate
+        self.colors = {cell: BLACK for cell in BOARD_CELLS}
+        self.packets = 0
+        self.bytes_received = 0
+        self.errors = 0
+        self.updated = threading.Condition()
+        self.parser = self.parse()
+        next(self.parser)
+
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self._running = False
+        self.thread = None
+
+    def feed(self, data):
+        for b in data:
+            self.parser.send(b)
+        self.bytes_received += len(data)
+
+    def parse(self):
+        """
+        Generator that receives the stream one byte at a time.
+        """
+        start_byte, end_byte = ArduinoSerialSender.START_BYTE, ArduinoSerialSender.END_BYTE
+        while True:
+            b = yield
+            if b != start_byte:
+                continue
+
+            command = yield
+            if command in (CMD_SET_HEXES, CMD_SET_FRAME):
+                length = yield
+                body = []
+                for _ in range(length):
+                    body.append((yield))
+                checksum = yield
+                end = yield
+                valid = end == end_byte and checksum == ArduinoSerialSender.checksum([command, length, *body])
+            else:
+                body = []
+                for _ in range(ArduinoSerialSender.NUM_BYTES - 1):
+                    body.append((yield))
+                end = yield
+                valid = end == end_byte
+
+            if not valid:
+                self.errors += 1
+                self.reply(f"ERR {command}")
+                continue
+
+            self.apply(command, body)
+
+    def apply(self, command, body):
+        with self.updated:
+            if command == CMD_CLEAR:
+                for cell in BOARD_CELLS:
+                    self.colors[cell] = BLACK
+            elif command == CMD_SET_HEX:
+                self.set_hex(*body)
+            elif command == CMD_SET_GOAL:
+                self.colors[BOARD_CELLS[-1]] = tuple(body[:3])
+            elif command == CMD_SET_HEXES:
+                for i in range(0, len(body), 5):
+                    self.set_hex(*body[i:i + 5])
+            elif command == CMD_SET_FRAME:
+                for i, cell in enumerate(BOARD_CELLS):
+                    self.colors[cell] = tuple(body[i * 3:i * 3 + 3])
+            else:
+                self.errors += 1
+                self.reply(f"ERR {command}")
+                return
+
+            self.packets += 1
+            self.updated.notify_all()
+
+    def set_hex(self, col, row, r, g, b):
+        if (col, row) not in self.colors:
+            self.errors += 1
+            return
+        self.colors[(col, row)] = (r, g, b)
+
+    def reply(self, line):
+        if self.master_fd is not None:
+            os.write(self.master_fd, (line + "\n").encode())
+
+    def wait_for(self, colors, timeout=1.0):
+        """
+        Waits until the cells have the given colors ({cell: color}). Returns False on timeout.
+        """
+        with self.updated:
+            return self.updated.wait_for(lambda: all(self.colors[cell] == color for cell, color in colors.items()),
+                                         timeout)
+
+    def start_pty(self):
+        """
+        Creates the pseudo-terminal and starts reading it. Returns the device to open as the serial port.
+        """
+        import pty
+        import tty
+
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.master_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self._running = True
+        self.thread = threading.Thread(target=self.read_loop, name="firmware_emulator", daemon=True)
+        self.thread.start()
+        return self.port
+
+    def read_loop(self):
+        while self._running:
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master_fd, 4096)
+            except OSError:
+                break
+            if self.baudrate:
+                # 10 bits per byte: start, 8 data bits and stop
+                time.sleep(len(data) * 10 / self.baudrate)
+            self.feed(data)
+
+    def stop(self):
+        self._running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+
+def create_frames(num_frames, seed=0):
+    """
+    Random LED changes like the ones of the game: a few hexagons at a time, a path or a clear.
+
+    Returns:
+        list: For each frame, the payloads to send and the colors of every cell after them.
+    """
+    rng = random.Random(seed)
+    hexes = BOARD_CELLS[:-1]
+    colors = {cell: BLACK for cell in BOARD_CELLS}
+    frames = []
+    for _ in range(num_frames):
+        payloads = []
+        if rng.random() < 0.1:
+            payloads.append((CMD_CLEAR, 0, 0, 0, 0, 0))
+            colors = {cell: BLACK for cell in BOARD_CELLS}
+        for cell in rng.sample(hexes, rng.choice((1, 2, 9))):
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            payloads.append((CMD_SET_HEX, *cell, *color))
+            colors[cell] = color
+        if rng.random() < 0.2:
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            payloads.append((CMD_SET_GOAL, *color, 0, 0))
+            colors[BOARD_CELLS[-1]] = color
+        frames.append((payloads, dict(colors)))
+    return frames
+
+
+def create_frame_payload(colors):
+    return CMD_SET_FRAME, *[b for cell in BOARD_CELLS for b in colors[cell]]
+
+
+def benchmark_protocols(num_frames=300, baudrate=115200):
+    """
+    Sends the same LED changes to the emulator through a pseudo-terminal with:
+        per packet - one write per packet, like the original sender
+        batched    - the packets of a frame in one write
+        bulk       - the hexagons of a frame in one CMD_SET_HEXES packet
+        full frame - every frame as one CMD_SET_FRAME packet
+    and reports the bytes sent, the time until the emulator shows each frame and whether the final
+    colors are right. The emulator reads at the speed of a serial line of the given baud rate.
+    """
+    frames = create_frames(num_frames)
+
+    for mode in ("per packet", "batched", "bulk", "full frame"):
+        emulator = BoardFirmwareEmulator(baudrate)
+        port = emulator.start_pty()
+        sender = ArduinoSerialSender(port, baudrate, bulk_protocol=mode == "bulk")
+        bytes_sent = 0
+        latencies = []
+        correct = True
+
+        start = time.perf_counter()
+        for payloads, colors in frames:
+            frame_start = time.perf_counter()
+            if mode == "per packet":
+                for payload in payloads:
+                    sender.send_bytes(*payload)
+                bytes_sent += len(sender.encode(payloads))
+            else:
+                packets = [create_frame_payload(colors)] if mode == "full frame" else payloads
+                sender.send_packets(packets)
+                bytes_sent += len(sender.encode(packets))
+
+            if not emulator.wait_for(colors, timeout=2.0):
+                correct = False
+            latencies.append(time.perf_counter() - frame_start)
+        elapsed = time.perf_counter() - start
+
+        correct = correct and emulator.errors == 0 and emulator.colors == frames[-1][1]
+        latencies.sort()
+        print(f"{mode:<10}: {bytes_sent / num_frames:6.1f} bytes/frame, {num_frames / elapsed:7.1f} frames/s, "
+              f"latency mean {sum(latencies) / len(latencies) * 1000:6.2f}ms "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f}ms, "
+              f"packets: {emulator.packets}, errors: {emulator.errors}, correct: {correct}")
+
+        sender.close()
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    if not sys.platform.startswith("linux"):
+        print("The firmware emulator needs a pseudo-terminal (Linux)")
+        exit(1)
+
+    benchmark_protocols(baudrate=int(sys.argv[1]) if len(sys.argv) > 1 else 115200)
@@ -1,17 +1,39 @@
 import serial
 import time
+import threading
+from collections import OrderedDict
 import logging
 
 logger = logging.getLogger(__name__)
 
+# commands of the protocol
+CMD_CLEAR = 0      # [242, 0, 0, 0, 0, 0, 0, 243]
+CMD_SET_HEX = 1    # [242, 1, col, row, r, g, b, 243]
+CMD_SET_GOAL = 2   # [242, 2, r, g, b, 0, 0, 243]
+CMD_SET_HEXES = 3  # [242, 3, length, (col, row, r, g, b) * n, checksum, 243]
+CMD_SET_FRAME = 4  # [242, 4, length, (r, g, b) for each cell of BOARD_CELLS, checksum, 243]
+
+# cells of the full board frame: the hexagons row by row, then the goal
+BOARD_CELLS = [(col, row) for row in range(8) for col in range(3 if row % 2 else 2)] + ["goal"]
+
 
 class ArduinoSerialSender:
     START_BYTE = 242
     END_BYTE = 243
     NUM_BYTES = 6
+    MAX_BULK_LENGTH = 255
 
-    def __init__(self, port, baudrate=115200, timeout=1, sender_delay=0.0):
+    def __init__(self, port, baudrate=115200, timeout=1, sender_delay=0.0, async_mode=False, bulk_protocol=False):
+        """
+        :param async_mode: Writes from a background thread, send_bytes and send_packets only queue the
+                           packets. A packet replaces the queued one with the same (command, col, row), so
+                           only the latest color of each hexagon is sent. The serial is read by another thread.
+        :param bulk_protocol: Sends consecutive hexagons in a single CMD_SET_HEXES packet. Needs a firmware
+                              that knows the bulk commands.
+        """
         self.sender_delay = sender_delay
+        self.async_mode = async_mode
+        self.bulk_protocol = bulk_protocol
         init_failed = False
         msg = ""
         try:
@@ -25,23 +47,224 @@ class ArduinoSerialSender:
             raise RuntimeError(msg)
         #time.sleep(0.5)  # Give Arduino time to reset after serial connection
 
-    def send_bytes(self, b0, b1, b2, b3, b4, b5):
-        data = [b0, b1, b2, b3, b4, b5]
-        if not all(0 <= b <= 255 for b in data):
+        self.pending = OrderedDict()  # (command, col, row) -> (payload, time queued)
+        self.condition = threading.Condition()
+        self.packets_written = 0
+        self.coalesced = 0  # queued packets replaced by a newer one before being written
+        self.max_queue_depth = 0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+        self.total_queue_time = 0.0
+        self.writes = 0
+
+        self._running = async_mode
+        self.writer_thread = None
+        self.reader_thread = None
+        if async_mode:
+            self.writer_thread = threading.Thread(target=self.write_loop, name="serial_writer", daemon=True)
+            self.reader_thread = threading.Thread(target=self.read_loop, name="serial_reader", daemon=True)
+            self.writer_thread.start()
+            self.reader_thread.start()
+
+    @staticmethod
+    def validate(payload):
+        if not all(0 <= b <= 255 for b in payload):
             raise ValueError("All byte values must be between 0 and 255.")
 
-        packet = bytearray([self.START_BYTE] + data + [self.END_BYTE])
-        self.ser.write(packet)
+    def send_bytes(self, b0, b1, b2, b3, b4, b5):
+        self.send_packets([(b0, b1, b2, b3, b4, b5)])
+
+    def send_packets(self, packets):
+        """
+        Sends several 6 byte payloads with a single write (or queues them, in async mode).
+        """
+        for payload in packets:
+            self.validate(payload)
+
+        if self.async_mode:
+            self.queue_packets(packets)
+            return
+
+        start = time.perf_counter()
+        self.ser.write(self.encode(packets))
+        self.update_write_stats(len(packets), time.perf_counter() - start, 0.0)
         if self.sender_delay > 0.0:
-            time.sleep(self.sender_delay)
+            # same pacing as sending the packets one by one
+            time.sleep(self.sender_delay * len(packets))
+
+    def encode(self, packets):
+        """
+        Encodes the payloads, as a CMD_SET_HEXES packet for each run of hexagons with the bulk protocol.
+        A CMD_SET_FRAME payload is (CMD_SET_FRAME, r, g, b, r, g, b, ...) in the order of BOARD_CELLS.
+        """
+        data = bytearray()
+        hexes = []
+
+        def encode_hexes():
+            if len(hexes) == 1:
+                data.extend(self.encode_packet((CMD_SET_HEX, *hexes[0])))
+            max_hexes = self.MAX_BULK_LENGTH // 5
+            for start in range(0, len(hexes) if len(hexes) > 1 else 0, max_hexes):
+                body = [b for hex_payload in hexes[start:start + max_hexes] for b in hex_payload]
+                data.extend(self.encode_bulk_packet(CMD_SET_HEXES, body))
+            hexes.clear()
+
+        for payload in packets:
+            if self.bulk_protocol and payload[0] == CMD_SET_HEX:
+                hexes.append(payload[1:6])
+                continue
+
+            encode_hexes()
+            if payload[0] == CMD_SET_FRAME:
+                data.extend(self.encode_bulk_packet(CMD_SET_FRAME, payload[1:]))
+            else:
+                data.extend(self.encode_packet(payload))
+        encode_hexes()
+
+        return data
+
+    @staticmethod
+    def encode_packet(payload):
+        return bytes([ArduinoSerialSender.START_BYTE, *payload, ArduinoSerialSender.END_BYTE])
+
+    @staticmethod
+    def encode_bulk_packet(command, body):
+        if len(body) > ArduinoSerialSender.MAX_BULK_LENGTH:
+            raise ValueError(f"Bulk packet too long: {len(body)} bytes")
+        packet = [command, len(body), *body]
+        return bytes([ArduinoSerialSender.START_BYTE, *packet, ArduinoSerialSender.checksum(packet),
+                      ArduinoSerialSender.END_BYTE])
+
+    @staticmethod
+    def checksum(data):
+        # XOR of the command, length and body bytes
+        result = 0
+        for b in data:
+            result ^= b
+        return result
+
+    def queue_packets(self, packets):
+        now = time.perf_counter()
+        with self.condition:
+            for payload in packets:
+                key = tuple(payload[:3]) if payload[0] == CMD_SET_HEX else (payload[0],)
+                if payload[0] in (CMD_CLEAR, CMD_SET_FRAME):
+                    # a clear or a full frame makes every queued change useless
+                    self.coalesced += len(self.pending)
+                    self.pending.clear()
+                elif key in self.pending:
+                    self.coalesced += 1
+                    self.pending.pop(key)
+                self.pending[key] = (tuple(payload), now)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+            self.condition.notify()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or not self._running)
+                if not self.pending and not self._running:
+                    break
+                items = list(self.pending.items())
+                self.pending.clear()
+
+            packets = [payload for _, (payload, _) in items]
+            try:
+                data = self.encode(packets)
+            except ValueError as e:
+                logger.error(f"Serial packets not encoded: {e}")
+                data = self.encode_each(packets)
+
+            start = time.perf_counter()
+            try:
+                self.ser.write(data)
+            except serial.SerialException as e:
+                logger.error(f"Serial write failed: {e}")
+                if not self._running:
+                    break  # closing, the packets are lost
+                self.requeue(items)
+                time.sleep(0.1)
+                continue
+            end = time.perf_counter()
+            self.update_write_stats(len(packets), end - start, sum(start - queued for _, (_, queued) in items))
+
+            if self.sender_delay > 0.0:
+                time.sleep(self.sender_delay * len(packets))
+
+    def encode_each(self, packets):
+        """
+        Encodes the payloads one by one, dropping the ones that can't be encoded.
+        """
+        data = bytearray()
+        for payload in packets:
+            try:
+                data.extend(self.encode([payload]))
+            except ValueError as e:
+                logger.error(f"Serial packet dropped {payload[:3]}: {e}")
+        return data
+
+    def requeue(self, items):
+        """
+        Puts back the items of a failed write in front of the queue, except the ones replaced by a newer
+        packet (all of them, if a clear or a full frame was queued since).
+        """
+        with self.condition:
+            if any(key[0] in (CMD_CLEAR, CMD_SET_FRAME) for key in self.pending):
+                return
+            pending = OrderedDict((key, item) for key, item in items if key not in self.pending)
+            pending.update(self.pending)
+            self.pending = pending
+            self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+
+    def update_write_stats(self, num_packets, write_time, queue_time):
+        self.writes += 1
+        self.packets_written += num_packets
+        self.total_write_time += write_time
+        self.max_write_time = max(self.max_write_time, write_time)
+        self.total_queue_time += queue_time
+
+    def read_loop(self):
+        while self._running:
+            try:
+                line = self.ser.readline().decode(errors='ignore').strip()
+            except serial.SerialException as e:
+                logger.error(f"Serial read failed: {e}")
+                time.sleep(0.5)
+                continue
+            if line:
+                logger.debug(f"Received: {line}")
 
     def read_serial(self):
+        if self.async_mode:
+            return  # read by the reader thread
+
         while self.ser.in_waiting > 0:
             line = self.ser.readline().decode(errors='ignore').strip()
             if line:
                 logger.debug(f"Received: {line}")
 
+    def get_stats(self):
+        with self.condition:
+            queue_depth = len(self.pending)
+        return {
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "packets_written": self.packets_written,
+            "coalesced": self.coalesced,
+            "avg_write_time": self.total_write_time / self.writes if self.writes > 0 else 0.0,
+            "max_write_time": self.max_write_time,
+            "avg_queue_time": self.total_queue_time / self.packets_written if self.packets_written > 0 else 0.0,
+        }
+
     def close(self):
+        # the writer sends what is still queued before stopping
+        self._running = False
+        with self.condition:
+            self.condition.notify_all()
+        for thread in (self.writer_thread, self.reader_thread):
+            if thread is not None and thread.is_alive():
+                thread.join(timeout=2.0)
+
         if self.ser.is_open:
             self.ser.close()
 
@@ -57,9 +280,15 @@ class DummyArduinoSerialSender:
     def send_bytes(self, b0, b1, b2, b3, b4, b5):
         logger.debug(f"Dummy send_bytes({b0}, {b1}, {b2}, {b3}, {b4}, {b5}")
 
+    def send_packets(self, packets):
+        logger.debug(f"Dummy send_packets({packets})")
+
     def read_serial(self):
         pass
 
+    def get_stats(self):
+        return {}
+
     def close(self):
         pass
 
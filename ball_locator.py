@@ -0,0 +1,167 @@
+import time
+import parameters as param
+from ball_tracker import BallTracker
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BallLocation:
+    def __init__(self, hex=None, cam_used=0, idx=-1, hexagon=None, bbox=None, conf=0, ball_pos=(0, 0)):
+        self.hex = hex            # (col, row) of the hexagon under the ball or None
+        self.cam_used = cam_used  # camera that found the ball (0 if none)
+        self.idx = idx            # index of the hexagon in the board model
+        self.hexagon = hexagon    # perspective polygon of the hexagon
+        self.bbox = bbox
+        self.conf = conf
+        self.ball_pos = ball_pos  # point where the ball touches the floor
+        self.board_pos = None     # position of the ball on the board plane (only with the ball tracker)
+        self.predicted = False    # True when the position comes from the tracker instead of a detection
+
+
+class BallLocator:
+    """
+    Finds the hexagon under the ball, looking at the cameras in the order given by param.CAMERA_PRIORITY.
+    """
+    def __init__(self, hex_model_cam1, hex_model_cam2):
+        self.hex_models = {1: hex_model_cam1, 2: hex_model_cam2}
+        self.tracking = False
+        self.tracking_changed = False
+        self.tracker = BallTracker(param.BALL_TRACKER_MODEL, param.BALL_TRACKER_PROCESS_NOISE,
+                                   param.BALL_TRACKER_MEASUREMENT_NOISE, param.BALL_TRACKER_MAX_PREDICTION_TIME)
+        self.frames_since_inference = 0
+
+    def set_tracking(self, tracking):
+        """
+        Enables tracking the ball while it is being played: the detector only searches around the last
+        position (param.TRACKING_INFERENCE, see YoloObjectDetector.detect_best_tracked) and the ball tracker
+        predicts the position between detections (param.BALL_TRACKER).
+        """
+        tracking = tracking and bool(param.TRACKING_INFERENCE or param.BALL_TRACKER)
+        if tracking != self.tracking:
+            # the detector is reset by the thread running locate, which may not be the caller
+            self.tracking_changed = True
+        self.tracking = tracking
+
+    def locate(self, ball_detector, frame1, frame2):
+        if self.tracking_changed:
+            self.tracking_changed = False
+            ball_detector.reset_tracking()
+            self.tracker.reset()
+
+        if self.tracking and param.BALL_TRACKER:
+            return self.locate_with_tracker(ball_detector, frame1, frame2)
+
+        if self.tracking or (param.BATCHED_INFERENCE and len(param.CAMERA_PRIORITY) > 1):
+            return self.locate_batch(ball_detector, frame1, frame2)
+
+        location = BallLocation()
+        for cam_id in param.CAMERA_PRIORITY:
+            frame = frame1 if cam_id == 1 else frame2
+            bbox, conf = ball_detector.detect_best(frame, param.MIN_CONFIDENCE_BALL, *self.get_roi(cam_id))
+            if bbox is not None:
+                self.resolve_hex(location, cam_id, bbox, conf)
+                break
+
+        return location
+
+    def locate_batch(self, ball_detector, frame1, frame2):
+        detections = self.detect_all(ball_detector, frame1, frame2)
+
+        # pick the camera by priority
+        location = BallLocation()
+        for cam_id, (bbox, conf) in zip(param.CAMERA_PRIORITY, detections):
+            if bbox is not None:
+                self.resolve_hex(location, cam_id, bbox, conf)
+                break
+
+        return location
+
+    def detect_all(self, ball_detector, frame1, frame2):
+        """
+        Runs a single inference for all cameras.
+
+        :return: List with a (bbox, conf) tuple per camera, in the order of param.CAMERA_PRIORITY.
+        """
+        frames = [frame1 if cam_id == 1 else frame2 for cam_id in param.CAMERA_PRIORITY]
+        rois, imgsz = None, None
+        if self.roi_enabled():
+            rois = [self.hex_models[cam_id].board_roi for cam_id in param.CAMERA_PRIORITY]
+            imgsz = param.ROI_INFERENCE_IMGSZ
+        if self.tracking and param.TRACKING_INFERENCE:
+            return ball_detector.detect_best_tracked(frames, param.CAMERA_PRIORITY, param.MIN_CONFIDENCE_BALL,
+                                                     rois, imgsz)
+        return ball_detector.detect_best_batch(frames, param.MIN_CONFIDENCE_BALL, rois, imgsz)
+
+    def locate_with_tracker(self, ball_detector, frame1, frame2):
+        """
+        Fuses the detections of all cameras in the ball tracker and resolves the hexagon from the tracked
+        position. While the tracker is confident the model only runs every param.BALL_TRACKER_INFERENCE_INTERVAL
+        frames, the other frames use the predicted position.
+        """
+        timestamp = time.monotonic()
+        self.frames_since_inference += 1
+        run_inference = self.frames_since_inference >= param.BALL_TRACKER_INFERENCE_INTERVAL or \
+            self.tracker.get_confidence(timestamp) < param.BALL_TRACKER_MIN_CONFIDENCE
+
+        location = BallLocation()
+        if run_inference:
+            self.frames_since_inference = 0
+            detections = self.detect_all(ball_detector, frame1, frame2)
+            for cam_id, (bbox, conf) in zip(param.CAMERA_PRIORITY, detections):
+                if bbox is None:
+                    continue
+                hex_model_cam = self.hex_models[cam_id]
+                ball_pos = hex_model_cam.ellipse_line_intersection(bbox, hex_model_cam.cam_pos)
+                self.tracker.update(hex_model_cam.image_to_board(ball_pos), timestamp, conf)
+                if location.cam_used == 0:
+                    location.cam_used = cam_id
+                    location.bbox = bbox
+                    location.conf = conf
+                    location.ball_pos = ball_pos
+
+        # without a detection in this frame the hexagon comes from the prediction
+        location.predicted = location.cam_used == 0
+
+        board_pos = self.tracker.predict(timestamp)
+        if board_pos is None or self.tracker.get_confidence(timestamp) < param.BALL_TRACKER_MIN_CONFIDENCE:
+            return location
+
+        location.board_pos = board_pos
+        hex_model_cam = self.hex_models[location.cam_used or param.CAMERA_PRIORITY[0]]
+        idx = hex_model_cam.find_hex_at_board_point(board_pos)
+        if idx >= 0:
+            location.idx = idx
+            location.hex = hex_model_cam.hex_coordinates[idx]
+            location.hexagon = hex_model_cam.pers_polygons[idx]
+
+        return location
+
+    def roi_enabled(self):
+        # the board region is only known after the calibration
+        return param.ROI_INFERENCE and all(model.board_roi is not None for model in self.hex_models.values())
+
+    def get_roi(self, cam_id):
+        """
+        Returns the (roi, imgsz) arguments of the detector for the camera.
+        """
+        if self.roi_enabled():
+            return self.hex_models[cam_id].board_roi, param.ROI_INFERENCE_IMGSZ
+        return None, None
+
+    def resolve_hex(self, location, cam_id, bbox, conf):
+        hex_model_cam = self.hex_models[cam_id]
+        idx, enabled_polygon, ball_pos = hex_model_cam.get_polygon_under_ball(bbox)
+
+        location.cam_used = cam_id
+        location.bbox = bbox
+        location.conf = conf
+        location.ball_pos = ball_pos
+        location.idx = idx
+        if param.HEX_LOOKUP_BOARD_PLANE:
+            location.board_pos = hex_model_cam.image_to_board(ball_pos)
+        if enabled_polygon is not None:
+            location.hex = hex_model_cam.hex_coordinates[idx]
+            location.hexagon = hex_model_cam.pers_polygons[idx]
+
+        return location
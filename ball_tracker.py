@@ -0,0 +1,126 @@
+import math
+import numpy as np
+
+
+class BallTracker:
+    """
+    Kalman filter of the ball position on the board plane (board model units, shared by both cameras).
+
+    The state is [x, y, vx, vy] for the constant velocity model or [x, y, vx, vy, ax, ay] for the
+    constant acceleration model. Detections of any camera are fused as position measurements, weighted
+    by their confidence, and the position is predicted between detections.
+    """
+    MODELS = ("velocity", "acceleration")
+
+    def __init__(self, model="velocity", process_noise=500.0, measurement_noise=2.0,
+                 max_prediction_time=0.5, confidence_scale=10.0):
+        """
+        :param model: "velocity" or "acceleration".
+        :param process_noise: Spectral density of the unmodelled motion (units^2/s^3 for the velocity model).
+        :param measurement_noise: Standard deviation of a detection with confidence 1.0, in board units.
+        :param max_prediction_time: Seconds without detections after which the track is lost.
+        :param confidence_scale: Position standard deviation, in board units, at which the confidence is 1/e.
+        """
+        if model not in self.MODELS:
+            raise ValueError(f"Invalid tracker model: {model}")
+
+        self.order = 2 if model == "velocity" else 3  # number of derivatives per axis, including position
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_prediction_time = max_prediction_time
+        self.confidence_scale = confidence_scale
+
+        size = self.order * 2
+        self.H = np.zeros((2, size))
+        self.H[0, 0] = 1
+        self.H[1, 1] = 1
+
+        self.x = np.zeros(size)
+        self.P = np.eye(size)
+        self.timestamp = None
+        self.last_update = None
+
+    def reset(self):
+        self.x = np.zeros(self.order * 2)
+        self.P = np.eye(self.order * 2)
+        self.timestamp = None
+        self.last_update = None
+
+    def is_initialized(self):
+        return self.timestamp is not None
+
+    def transition(self, dt):
+        # one axis, then expanded to [x, y, vx, vy, ...] with the Kronecker product
+        if self.order == 2:
+            F1 = np.array([[1, dt],
+                           [0, 1]])
+            G1 = np.array([dt ** 2 / 2, dt])
+        else:
+            F1 = np.array([[1, dt, dt ** 2 / 2],
+                           [0, 1, dt],
+                           [0, 0, 1]])
+            G1 = np.array([dt ** 3 / 6, dt ** 2 / 2, dt])
+
+        # discrete white noise on the highest derivative
+        Q1 = np.outer(G1, G1) * self.process_noise * dt
+        return np.kron(F1, np.eye(2)), np.kron(Q1, np.eye(2))
+
+    def predict(self, timestamp):
+        """
+        Advances the state to timestamp (in seconds) and returns the predicted (x, y) position.
+        """
+        if not self.is_initialized():
+            return None
+
+        dt = timestamp - self.timestamp
+        if dt > 0:
+            F, Q = self.transition(dt)
+            self.x = F @ self.x
+            self.P = F @ self.P @ F.T + Q
+            self.timestamp = timestamp
+
+        return self.get_position()
+
+    def update(self, point, timestamp, conf=1.0):
+        """
+        Fuses a detection of the ball position (board coordinates) taken at timestamp (in seconds).
+        """
+        std = self.measurement_noise / max(conf, 0.05)
+        R = np.eye(2) * std ** 2
+
+        if not self.is_initialized():
+            self.x[:] = 0
+            self.x[:2] = point
+            self.P = np.eye(self.order * 2) * 1000.0
+            self.P[:2, :2] = R
+            self.timestamp = timestamp
+            self.last_update = timestamp
+            return
+
+        self.predict(timestamp)
+
+        y = np.asarray(point, dtype=np.float64) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(self.order * 2) - K @ self.H) @ self.P
+        self.last_update = timestamp
+
+    def get_position(self):
+        if not self.is_initialized():
+            return None
+        return float(self.x[0]), float(self.x[1])
+
+    def get_confidence(self, timestamp=None):
+        """
+        Confidence (0 to 1) of the position, decreasing with its uncertainty. It is 0 when the track
+        is lost (no detections for more than max_prediction_time seconds).
+        """
+        if not self.is_initialized():
+            return 0.0
+
+        if timestamp is not None and timestamp - self.last_update > self.max_prediction_time:
+            return 0.0
+
+        position_std = math.sqrt(max(self.P[0, 0] + self.P[1, 1], 0.0) / 2)
+        return math.exp(-position_std / self.confidence_scale)
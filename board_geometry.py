@@ -0,0 +1,183 @@
+import os
+import cv2
+import numpy as np
+
+
+class BoardGeometry:
+    """
+    Immutable geometry of the hexagons on the board plane, shared by the models of both cameras.
+
+    The vertices of all hexagons are kept in one contiguous float32 array, the vertices of hexagon i
+    being vertices[offsets[i]:offsets[i+1]], so the whole board is projected with a single transform.
+    """
+    def __init__(self, hexagons, hex_coordinates, bounds):
+        """
+        :param hexagons: Polygons of the hexagons (lists of (x, y) points), in the order of hex_coordinates.
+        :param hex_coordinates: (col, row) of each hexagon.
+        :param bounds: (1, 4, 2) corners of the board rectangle that is mapped to the calibration quad.
+        """
+        self.offsets = np.cumsum([0] + [len(hexagon) for hexagon in hexagons])
+        self.vertices = np.ascontiguousarray(np.concatenate(
+            [np.asarray(hexagon, dtype=np.float32).reshape(-1, 2) for hexagon in hexagons]))
+        self.hexagons = self.split(self.vertices)
+        self.centroids = np.array([np.unique(hexagon, axis=0).mean(axis=0) for hexagon in self.hexagons],
+                                  dtype=np.float32)
+        self.hex_coordinates = tuple(tuple(coord) for coord in hex_coordinates)
+        self.coordinates = np.array(self.hex_coordinates, dtype=np.int32)
+        self.hex_index = {coord: idx for idx, coord in enumerate(self.hex_coordinates)}
+        self.bounds = np.array(bounds, dtype=np.float32)
+        self.create_lattice()
+        self.create_edges()
+
+        for array in (self.offsets, self.vertices, self.centroids, self.coordinates, self.bounds,
+                      self.lattice_row_y, self.lattice_row_x0, self.lattice_num_cols, self.lattice_index,
+                      self.edge_start, self.edge_end):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.hexagons)
+
+    def split(self, vertices):
+        """
+        Splits an array with one row per vertex (e.g. the vertices projected onto a camera frame)
+        into a tuple of per hexagon views.
+        """
+        return tuple(vertices[start:end] for start, end in zip(self.offsets[:-1], self.offsets[1:]))
+
+    def create_lattice(self):
+        """
+        Describes the hexagon lattice: the y of each row, the x of the first column of each row and the
+        distances between rows and columns.
+        """
+        rows = sorted(set(row for _, row in self.hex_coordinates))
+        self.lattice_row_y = np.array([self.centroids[self.coordinates[:, 1] == r][:, 1].mean() for r in rows])
+        self.lattice_row_x0 = np.array([self.centroids[self.hex_index[(0, r)]][0] for r in rows])
+        self.lattice_num_cols = np.array([np.count_nonzero(self.coordinates[:, 1] == r) for r in rows])
+        # index of the hexagon at [row, col], -1 past the end of a row
+        self.lattice_index = np.full((len(rows), self.lattice_num_cols.max()), -1, dtype=np.int64)
+        for (col, row), idx in self.hex_index.items():
+            self.lattice_index[row, col] = idx
+
+        col_steps = [self.centroids[self.hex_index[(col + 1, row)]][0] - self.centroids[idx][0]
+                     for (col, row), idx in self.hex_index.items() if (col + 1, row) in self.hex_index]
+        self.lattice_col_pitch = float(np.median(col_steps))
+        self.lattice_row_pitch = float(np.median(np.diff(self.lattice_row_y)))
+
+    def create_edges(self):
+        """
+        Edges of every hexagon as (num_hexagons, max_vertices, 2) start and end points, for the vectorized
+        polygon test. Shorter polygons are padded with their last vertex, which adds edges of length 0.
+        """
+        max_vertices = int(np.diff(self.offsets).max())
+        self.edge_start = np.empty((len(self.hexagons), max_vertices, 2), dtype=np.float32)
+        self.edge_end = np.empty_like(self.edge_start)
+        for idx, hexagon in enumerate(self.hexagons):
+            self.edge_start[idx, :len(hexagon)] = hexagon
+            self.edge_end[idx, :len(hexagon)] = np.roll(hexagon, -1, axis=0)
+            self.edge_start[idx, len(hexagon):] = hexagon[0]
+            self.edge_end[idx, len(hexagon):] = hexagon[0]
+
+    def find_hex_at_board_point(self, board_point):
+        """
+        Returns the index of the hexagon containing the board point or -1.
+
+        The row and column are calculated from the lattice, so only the polygons of the nearest hexagons
+        (at most one per neighbour row) are tested, no matter how many hexagons the board has.
+        """
+        x, y = float(board_point[0]), float(board_point[1])
+        num_rows = len(self.lattice_row_y)
+        row = int(round((y - self.lattice_row_y[0]) / self.lattice_row_pitch))
+
+        candidates = []
+        for r in range(max(row - 1, 0), min(row + 2, num_rows)):
+            col = int(round((x - self.lattice_row_x0[r]) / self.lattice_col_pitch))
+            col = min(max(col, 0), self.lattice_num_cols[r] - 1)
+            idx = self.hex_index[(col, r)]
+            cx, cy = self.centroids[idx]
+            candidates.append(((x - cx) ** 2 + (y - cy) ** 2, idx))
+
+        # the first row and the goal are not regular hexagons, so the polygon has the final word
+        for _, idx in sorted(candidates):
+            if cv2.pointPolygonTest(self.hexagons[idx], (x, y), False) >= 0:
+                return idx
+
+        return -1
+
+    def find_hexes_at_board_points(self, board_points):
+        """
+        Vectorized find_hex_at_board_point for an (N, 2) array of board points.
+
+        The row and column candidates come from the lattice like for a single point, and the polygons of
+        the candidates are tested with an even-odd ray crossing test of all their edges at once.
+
+        :return: (N,) hexagon indices, -1 for points outside of the board.
+        """
+        points = np.asarray(board_points, dtype=np.float64).reshape(-1, 2)
+        x, y = points[:, 0:1], points[:, 1:2]
+        num_rows = len(self.lattice_row_y)
+
+        # (N, 3) candidates: the nearest row and its neighbours
+        row = np.rint((y - self.lattice_row_y[0]) / self.lattice_row_pitch).astype(np.int64)
+        rows = row + np.arange(-1, 2)
+        valid = (rows >= 0) & (rows < num_rows)
+        rows = np.clip(rows, 0, num_rows - 1)
+        cols = np.rint((x - self.lattice_row_x0[rows]) / self.lattice_col_pitch).astype(np.int64)
+        cols = np.clip(cols, 0, self.lattice_num_cols[rows] - 1)
+        candidates = self.lattice_index[rows, cols]
+
+        # nearest centroid first, like the single point version
+        distances = ((x - self.centroids[candidates, 0]) ** 2 + (y - self.centroids[candidates, 1]) ** 2)
+        distances[~valid] = np.inf
+        order = np.argsort(distances, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        valid = np.take_along_axis(valid, order, axis=1)
+
+        # (N, 3, max_vertices) crossings of a ray to the right of the point
+        px, py = x[:, :, np.newaxis], y[:, :, np.newaxis]
+        x0, y0 = self.edge_start[candidates, :, 0], self.edge_start[candidates, :, 1]
+        x1, y1 = self.edge_end[candidates, :, 0], self.edge_end[candidates, :, 1]
+        straddles = (y0 > py) != (y1 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing_x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        inside = (np.count_nonzero(straddles & (px < crossing_x), axis=2) % 2 == 1) & valid
+
+        found = inside.any(axis=1)
+        first = np.argmax(inside, axis=1)
+        return np.where(found, candidates[np.arange(len(points)), first], -1)
+
+    def save(self, file_path, key):
+        """
+        Writes the geometry to a .npz file. key identifies the source of the geometry (see load).
+        """
+        # written to a temporary file first, so an interrupted write never leaves a truncated file, and
+        # through a file object so numpy doesn't append another .npz to the name
+        tmp_file = f"{file_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, key=np.array(key), vertices=self.vertices, offsets=self.offsets,
+                         coordinates=self.coordinates, bounds=self.bounds)
+            os.replace(tmp_file, file_path)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    @staticmethod
+    def load(file_path, key):
+        """
+        Reads a geometry written by save.
+
+        :return: The geometry or None if the file was saved with a different key.
+        """
+        with np.load(file_path) as data:
+            if str(data["key"]) != key:
+                return None
+            vertices, offsets = data["vertices"], data["offsets"]
+            hexagons = [vertices[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+            return BoardGeometry(hexagons, [tuple(coord) for coord in data["coordinates"].tolist()], data["bounds"])
+
+    def memory_size(self):
+        """
+        Bytes used by the arrays of the geometry.
+        """
+        return sum(array.nbytes for array in (self.offsets, self.vertices, self.centroids, self.coordinates,
+                                              self.bounds))
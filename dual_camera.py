@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+import time
 from cv2_utils import stack_frames_vertically, stack_frames_horizontally
 import threading
 from camera_initializer import CameraInitializer
@@ -9,6 +10,126 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class CameraReader(threading.Thread):
+    """
+    Reads frames from a single camera in its own thread and keeps only the newest one.
+
+    The newest frame is kept in a preallocated slot together with its capture timestamp
+    (time.monotonic()) and a sequence number, so the consumer never waits for the camera.
+    """
+    MAX_CONSECUTIVE_FAILURES = 30
+
+    def __init__(self, name, cap, width=1280, height=720):
+        super().__init__(daemon=True)
+        self.name = name
+        self.cap = cap
+        self.cap_lock = threading.Lock()  # serializes cap.read() and cap.set() calls
+        self.lock = threading.Lock()      # protects the latest-frame slot
+        self.frame_ready = threading.Condition(self.lock)  # notified when the slot has a new frame
+        self.first_frame = threading.Event()
+        self.new_frame = threading.Event()
+        self._running = True
+
+        # latest-frame slot (front) and the buffer being filled by the camera (back)
+        self._front = np.zeros((height, width, 3), dtype=np.uint8)
+        self._back = np.zeros((height, width, 3), dtype=np.uint8)
+
+        self.sequence = 0
+        self.timestamp = 0.0
+        self.last_consumed_sequence = 0
+        self.dropped_frames = 0
+        self.read_failures = 0
+        self.consecutive_failures = 0
+        self.last_frame_age = 0.0
+
+    def run(self):
+        while self._running:
+            with self.cap_lock:
+                ret, frame = self.cap.read(self._back)
+
+            if not ret:
+                self.read_failures += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.MAX_CONSECUTIVE_FAILURES:
+                    logger.critical(f"Camera {self.name}: too many consecutive read failures")
+                    self._running = False
+                    self.first_frame.set()  # wake up anyone waiting for the first frame
+                else:
+                    time.sleep(0.005)
+                continue
+
+            timestamp = time.monotonic()
+            self.consecutive_failures = 0
+            with self.lock:
+                # cap.read() only fills the given buffer in place if its shape matches
+                self._back = self._front
+                self._front = frame
+                self.timestamp = timestamp
+                self.sequence += 1
+                self.frame_ready.notify_all()
+            self.first_frame.set()
+            self.new_frame.set()
+
+    def wait_new_frame(self, timeout):
+        self.new_frame.wait(timeout)
+        self.new_frame.clear()
+
+    def wait_frame_after(self, timestamp, skip=1, timeout=2.0):
+        """
+        Waits until the slot has a frame captured after timestamp (time.monotonic()) and skip more frames.
+
+        The frames are timestamped when the read returns, so the first one after timestamp may have been
+        exposed before it.
+
+        :return: False on timeout or if the camera failed.
+        """
+        deadline = time.monotonic() + timeout
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(lambda: self.timestamp > timestamp or self.is_failed(), timeout):
+                return False
+            sequence = self.sequence + skip
+            return self.frame_ready.wait_for(lambda: self.sequence >= sequence or self.is_failed(),
+                                             max(deadline - time.monotonic(), 0.0)) and not self.is_failed()
+
+    def is_failed(self):
+        return self.consecutive_failures >= self.MAX_CONSECUTIVE_FAILURES
+
+    def get_latest(self, timeout=5.0):
+        """
+        Returns a copy of the newest frame without waiting for the camera (except for the very first frame).
+
+        :return: (frame, sequence, age in seconds) or (None, 0, 0.0) if no frame is available.
+        """
+        if not self.first_frame.wait(timeout) or self.is_failed():
+            return None, 0, 0.0
+
+        with self.lock:
+            frame = self._front.copy()
+            sequence = self.sequence
+            timestamp = self.timestamp
+
+        # frames captured between two consumptions were never seen by the game
+        if self.last_consumed_sequence and sequence > self.last_consumed_sequence + 1:
+            self.dropped_frames += sequence - self.last_consumed_sequence - 1
+        self.last_consumed_sequence = sequence
+        self.last_frame_age = time.monotonic() - timestamp
+
+        return frame, sequence, self.last_frame_age
+
+    def get_stats(self):
+        return {
+            "sequence": self.sequence,
+            "frame_age": self.last_frame_age,
+            "dropped_frames": self.dropped_frames,
+            "read_failures": self.read_failures,
+        }
+
+    def stop(self):
+        self._running = False
+        if self.is_alive():
+            self.join(timeout=1.0)
+
+
 class DualCamera:
     def __init__(self, cam1_id, cam2_id, res1=(640, 480), res2=(640, 480)):
         #print(f"start camera {cam1_id}")
@@ -31,13 +152,32 @@ class DualCamera:
 
         self.black_frame = np.zeros((720, 1280, 3), dtype=np.uint8)
 
-    def set_exposure1(self, exposure):
+        # optional capture threads, one per camera
+        self.reader1 = self.reader2 = None
+        if param.CAMERA_THREADED_CAPTURE:
+            if 1 in param.CAMERA_PRIORITY:
+                self.reader1 = CameraReader(1, self.cam1)
+                self.reader1.start()
+            if 2 in param.CAMERA_PRIORITY:
+                self.reader2 = CameraReader(2, self.cam2)
+                self.reader2.start()
+
+    @staticmethod
+    def set_camera_exposure(init, reader, exposure, save):
+        # cv2.VideoCapture is not thread safe, so don't change it in the middle of a read
+        if reader is not None:
+            with reader.cap_lock:
+                init.set_exposure(exposure, save)
+        else:
+            init.set_exposure(exposure, save)
+
+    def set_exposure1(self, exposure, save=True):
         if 1 in param.CAMERA_PRIORITY:
-            self.init1.set_exposure(exposure)
+            self.set_camera_exposure(self.init1, self.reader1, exposure, save)
 
-    def set_exposure2(self, exposure):
+    def set_exposure2(self, exposure, save=True):
         if 2 in param.CAMERA_PRIORITY:
-            self.init2.set_exposure(exposure)
+            self.set_camera_exposure(self.init2, self.reader2, exposure, save)
 
     def get_exposure1(self):
         if 1 in param.CAMERA_PRIORITY:
@@ -86,6 +226,9 @@ class DualCamera:
         return cap
 
     def get_frames(self):
+        if param.CAMERA_THREADED_CAPTURE:
+            return self.get_latest_frames()
+
         ret1 = True
         ret2 = True
         frame1 = frame2 = self.black_frame
@@ -100,6 +243,61 @@ class DualCamera:
 
         return frame1, frame2
 
+    def get_latest_frames(self):
+        """
+        Returns the newest frame of each camera, filled by the capture threads, without waiting for the cameras.
+        """
+        frame1 = frame2 = self.black_frame
+
+        if self.reader1 is not None:
+            frame1, _, _ = self.reader1.get_latest()
+        if self.reader2 is not None:
+            frame2, _, _ = self.reader2.get_latest()
+
+        if frame1 is None or frame2 is None:
+            raise RuntimeError("Failed to read from one or both cameras.")
+
+        return frame1, frame2
+
+    def get_frames_after(self, timestamp, skip=1, timeout=2.0):
+        """
+        Returns frames of both cameras captured after timestamp (time.monotonic()), e.g. the time the exposure
+        or the LEDs were changed, discarding skip more frames that may have been exposed before it.
+
+        Without the capture threads, skip frames buffered by the camera are read and discarded.
+        """
+        if not param.CAMERA_THREADED_CAPTURE:
+            for _ in range(skip):
+                self.get_frames()
+            return self.get_frames()
+
+        for reader in (self.reader1, self.reader2):
+            if reader is not None and not reader.wait_frame_after(timestamp, skip, timeout):
+                raise RuntimeError(f"No new frame from camera {reader.name}.")
+
+        return self.get_latest_frames()
+
+    def wait_new_frames(self, timeout=0.1):
+        """
+        Waits for a new frame of the main camera, to avoid consuming the same frames again when
+        the capture threads are running.
+        """
+        readers = {1: self.reader1, 2: self.reader2}
+        reader = readers.get(param.CAMERA_PRIORITY[0]) if param.CAMERA_PRIORITY else None
+        if reader is not None:
+            reader.wait_new_frame(timeout)
+
+    def get_capture_stats(self):
+        """
+        Returns the capture statistics of each camera (frame age in seconds, dropped frames and read failures).
+        """
+        stats = {}
+        if self.reader1 is not None:
+            stats[1] = self.reader1.get_stats()
+        if self.reader2 is not None:
+            stats[2] = self.reader2.get_stats()
+        return stats
+
     def display(self, final_width, final_height, vertical=True):
         window_title = "Pressione espaco para continuar..."
         while True:
@@ -126,6 +324,10 @@ class DualCamera:
         return self.get_exposure1(), self.get_exposure2(), key
 
     def release(self):
+        for reader in (self.reader1, self.reader2):
+            if reader is not None:
+                reader.stop()
+
         if 1 in param.CAMERA_PRIORITY:
             if self.cam1.isOpened():
                 self.cam1.release()
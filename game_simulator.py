@@ -0,0 +1,289 @@
+import sys
+import time
+import itertools
+import multiprocessing
+import numpy as np
+import parameters as param
+import scoring
+from hex_graph import HexGraph
+
+# simulated player, times in seconds
+DEFAULT_PLAYER = {
+    "step_time": 0.8,        # mean time to move the ball to the next hexagon
+    "step_time_shape": 4.0,  # shape of the gamma distribution of the step times, higher is more regular
+    "wrong_prob": 0.1,       # probability of touching a hexagon out of the path on each step
+    "miss_prob": 0.05,       # probability of the camera missing a hexagon of the path
+    "shot_time": 1.0,        # mean time from the last hexagon of the path to the goal
+    "goal_prob": 0.7,        # probability of scoring the shot
+}
+
+OUTCOME_GOAL = 0
+OUTCOME_OFFSIDE = 1
+OUTCOME_TIMEOUT = 2
+
+
+class VectorizedPathSampler:
+    """
+    Draws many paths of a HexGraph at once, with the same distributions as create_random_path and
+    create_random_path_target_size.
+
+    The walk states of the graph (see HexGraph.get_transitions) are numbered and their transitions and
+    length distributions are kept in arrays, so each step of all walks is a few array operations.
+    """
+    def __init__(self, graph):
+        self.coordinates = list(graph.nodes)  # node id -> (col, row)
+        node_ids = {coord: idx for idx, coord in enumerate(self.coordinates)}
+        self.start_cols = sorted(col for col, row in graph.nodes if row == 0)
+
+        start_states = [(graph.get_node(col, 0), frozenset([graph.get_node(col, 0)])) for col in self.start_cols]
+        states = list(start_states)
+        state_ids = {state: idx for idx, state in enumerate(states)}
+        transitions = []
+        while len(transitions) < len(states):
+            state_transitions = graph.get_transitions(states[len(transitions)])
+            for next_state, _ in state_transitions:
+                if next_state not in state_ids:
+                    state_ids[next_state] = len(states)
+                    states.append(next_state)
+            transitions.append(state_transitions)
+
+        num_states = len(states)
+        max_links = max(len(state_transitions) for state_transitions in transitions)
+        self.max_size = max(max(graph.get_length_distribution(state)) for state in start_states)
+        self.state_nodes = np.array([node_ids[(node.col, node.row)] for node, _ in states])
+        self.terminal = np.array([len(state_transitions) == 0 for state_transitions in transitions])
+
+        # padded with probability 0
+        self.next_states = np.zeros((num_states, max_links), dtype=np.int64)
+        self.probabilities = np.zeros((num_states, max_links))
+        for s, state_transitions in enumerate(transitions):
+            for k, (next_state, probability) in enumerate(state_transitions):
+                self.next_states[s, k] = state_ids[next_state]
+                self.probabilities[s, k] = probability
+
+        # length_distributions[s, size]: probability of the rest of the path from s having size nodes
+        self.length_distributions = np.zeros((num_states, self.max_size + 1))
+        for s, state in enumerate(states):
+            for size, probability in graph.get_length_distribution(state).items():
+                self.length_distributions[s, size] = probability
+
+    @staticmethod
+    def choose(weights, rng):
+        """
+        Draws one column index per row of weights, proportionally to the weights.
+        """
+        cumulative = np.cumsum(weights, axis=1)
+        u = rng.random(len(weights)) * cumulative[:, -1]
+        k = np.count_nonzero(cumulative <= u[:, np.newaxis], axis=1)
+        return np.minimum(k, weights.shape[1] - 1)
+
+    def sample(self, num_paths, start_cols=None, target_size=None, rng=None):
+        """
+        Draws paths like create_random_path, or create_random_path_target_size when target_size is given.
+
+        :param start_cols: Start column of each path, None draws them uniformly.
+        :return: ((num_paths, max_size) node ids padded with -1, (num_paths,) sizes).
+        """
+        rng = rng or np.random.default_rng()
+        if start_cols is None:
+            start_cols = rng.integers(len(self.start_cols), size=num_paths)
+        state = np.asarray(start_cols, dtype=np.int64).copy()  # the start states are the first ones
+
+        max_size = self.max_size
+        if target_size is not None:
+            if target_size > self.max_size or np.any(self.length_distributions[state, target_size] == 0):
+                raise ValueError(f"There is no path of size {target_size}")
+            max_size = target_size
+
+        nodes = np.full((num_paths, max_size), -1, dtype=np.int64)
+        nodes[:, 0] = self.state_nodes[state]
+        sizes = np.ones(num_paths, dtype=np.int64)
+        for step in range(1, max_size):
+            active = ~self.terminal[state] if target_size is None else np.ones(num_paths, dtype=bool)
+            if not active.any():
+                break
+
+            s = state[active]
+            weights = self.probabilities[s]
+            if target_size is not None:
+                # same weighting as create_random_path_target_size
+                weights = weights * self.length_distributions[self.next_states[s], target_size - step]
+            k = self.choose(weights, rng)
+
+            state[active] = self.next_states[s, k]
+            nodes[active, step] = self.state_nodes[state[active]]
+            sizes[active] += 1
+
+        return nodes, sizes
+
+
+def simulate_players(sizes, player, max_time, offside_enabled, rng):
+    """
+    Simulates a player going through paths of the given sizes, following the rules of KingOfControl.run_game.
+
+    Returns:
+        dict: Arrays with the number of correct and wrong hexagons, goal, playing time and outcome of each game.
+    """
+    num_games = len(sizes)
+    max_size = sizes.max()
+    shape = player["step_time_shape"]
+    steps = np.arange(max_size)
+    valid = steps[np.newaxis, :] < sizes[:, np.newaxis]
+
+    # the ball is already on the first hexagon when the game starts
+    step_times = rng.gamma(shape, player["step_time"] / shape, (num_games, max_size))
+    step_times[:, 0] = 0.0
+    wrong = (rng.random((num_games, max_size)) < player["wrong_prob"]) & valid
+    wrong[:, 0] = False
+    # a wrong hexagon is touched before the player gets back to the path
+    wrong_times = rng.gamma(shape, player["step_time"] / shape, (num_games, max_size)) * wrong
+    arrival_times = np.cumsum(step_times + wrong_times, axis=1)
+    wrong_touch_times = arrival_times - step_times
+    missed = rng.random((num_games, max_size)) < player["miss_prob"]
+    missed[:, 0] = False
+
+    end_time = np.full(num_games, float(max_time))
+    offside = np.zeros(num_games, dtype=bool)
+    last_step = np.full(num_games, max_size)  # steps from here on are never played
+    if offside_enabled:
+        first_wrong = np.where(wrong.any(axis=1), wrong.argmax(axis=1), max_size)
+        offside_time = wrong_touch_times[np.arange(num_games), np.minimum(first_wrong, max_size - 1)]
+        offside = (first_wrong < max_size) & (offside_time < max_time)
+        end_time[offside] = offside_time[offside]
+        last_step[offside] = first_wrong[offside]
+
+    played = valid & (steps[np.newaxis, :] < last_step[:, np.newaxis])
+    num_correct = np.count_nonzero(played & ~missed & (arrival_times < end_time[:, np.newaxis]), axis=1)
+    num_wrong = np.count_nonzero(wrong & (steps[np.newaxis, :] <= last_step[:, np.newaxis]) &
+                                 (wrong_touch_times < max_time), axis=1)
+
+    last_arrival = arrival_times[np.arange(num_games), sizes - 1]
+    goal_time = last_arrival + rng.gamma(shape, player["shot_time"] / shape, num_games)
+    goal = ~offside & (rng.random(num_games) < player["goal_prob"]) & (goal_time < max_time)
+
+    playing_time = np.full(num_games, float(max_time))
+    playing_time[goal] = goal_time[goal]
+    # the time keeps running while the offside is shown
+    playing_time[offside] = np.minimum(end_time[offside] + param.OFFSIDE_TIME, max_time)
+
+    outcome = np.full(num_games, OUTCOME_TIMEOUT)
+    outcome[goal] = OUTCOME_GOAL
+    outcome[offside] = OUTCOME_OFFSIDE
+
+    return {
+        "correct": num_correct,
+        "wrong": num_wrong,
+        "goal": goal.astype(np.int64),
+        "playing_time": playing_time,
+        "outcome": outcome,
+    }
+
+
+def simulate(config, num_games=100000, seed=None, batch_size=100000):
+    """
+    Simulates num_games games with a configuration and summarizes the results.
+
+    :param config: dict with any of: target_path_size, even_links, odd_links (see HexGraph), score_values
+                   (see scoring.get_score_values), player (overrides of DEFAULT_PLAYER), max_time and
+                   offside (end the game on the first wrong hexagon, by default only in the NORMAL game mode,
+                   like param.GAME_MODE).
+    """
+    rng = np.random.default_rng(seed)
+    graph = HexGraph(config.get("even_links"), config.get("odd_links"))
+    sampler = VectorizedPathSampler(graph)
+    target_size = config.get("target_path_size", param.TARGET_PATH_SIZE)
+    player = {**DEFAULT_PLAYER, **config.get("player", {})}
+    max_time = config.get("max_time", param.MAX_TIME)
+    score_values = {**scoring.get_score_values(), **config.get("score_values", {})}
+
+    # sizes of the paths of create_random_path, to see how often the target size happens
+    _, free_sizes = sampler.sample(min(num_games, batch_size), rng=rng)
+    size_counts = np.bincount(free_sizes, minlength=sampler.max_size + 1)
+
+    scores, durations, outcomes, correct, wrong = [], [], [], [], []
+    for start in range(0, num_games, batch_size):
+        _, sizes = sampler.sample(min(batch_size, num_games - start), target_size=target_size, rng=rng)
+        games = simulate_players(sizes, player, max_time, config.get("offside", param.GAME_MODE == 0), rng)
+
+        time_left = max_time - games["playing_time"]
+        scores.append(scoring.calculate_score(games["correct"], games["wrong"], games["goal"], time_left,
+                                              score_values))
+        # from the start of the game to the END screen
+        extra_time = np.select([games["outcome"] == OUTCOME_GOAL, games["outcome"] == OUTCOME_OFFSIDE],
+                               [param.GOAL_TIME, 0.0], 0.0)
+        durations.append(games["playing_time"] + extra_time)
+        outcomes.append(games["outcome"])
+        correct.append(games["correct"])
+        wrong.append(games["wrong"])
+
+    scores = np.concatenate(scores)
+    durations = np.concatenate(durations)
+    outcomes = np.concatenate(outcomes)
+
+    return {
+        "config": config,
+        "num_games": num_games,
+        "path_sizes": {size: count / len(free_sizes) for size, count in enumerate(size_counts) if count > 0},
+        "score_mean": float(scores.mean()),
+        "score_std": float(scores.std()),
+        "score_percentiles": {p: float(v) for p, v in zip((5, 50, 95), np.percentile(scores, (5, 50, 95)))},
+        "goal_rate": float(np.mean(outcomes == OUTCOME_GOAL)),
+        "offside_rate": float(np.mean(outcomes == OUTCOME_OFFSIDE)),
+        "timeout_rate": float(np.mean(outcomes == OUTCOME_TIMEOUT)),
+        "correct_mean": float(np.concatenate(correct).mean()),
+        "wrong_mean": float(np.concatenate(wrong).mean()),
+        "game_duration_mean": float(durations.mean()),
+        # CTA -> COUNTDOWN -> GAME -> END -> CTA, without the time waiting for a player
+        "cycle_duration_mean": float(param.COUNTDOWN_TIME + durations.mean() + param.END_TIME),
+    }
+
+
+def simulate_job(args):
+    return simulate(*args)
+
+
+def sweep(configs, num_games=100000, processes=None, seed=0):
+    """
+    Simulates every configuration in parallel, one process per configuration at a time.
+    """
+    jobs = [(config, num_games, seed + i) for i, config in enumerate(configs)]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(simulate_job, jobs)
+
+
+def create_configs(**options):
+    """
+    Returns the configurations of all combinations of the options, e.g.
+    create_configs(target_path_size=[8, 9, 10], player=[{"wrong_prob": 0.05}, {"wrong_prob": 0.2}]).
+    """
+    keys = list(options)
+    return [dict(zip(keys, values)) for values in itertools.product(*(options[key] for key in keys))]
+
+
+def print_summary(summary):
+    print(f"config: {summary['config']}")
+    print(f"  score: {summary['score_mean']:8.1f} +- {summary['score_std']:6.1f}  "
+          f"p5/p50/p95: {summary['score_percentiles'][5]:.0f}/{summary['score_percentiles'][50]:.0f}/"
+          f"{summary['score_percentiles'][95]:.0f}")
+    print(f"  goal: {summary['goal_rate']:.3f}  offside: {summary['offside_rate']:.3f}  "
+          f"timeout: {summary['timeout_rate']:.3f}  correct: {summary['correct_mean']:.2f}  "
+          f"wrong: {summary['wrong_mean']:.2f}")
+    print(f"  game duration: {summary['game_duration_mean']:.2f}s  cycle: {summary['cycle_duration_mean']:.2f}s")
+
+
+if __name__ == "__main__":
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    start = time.perf_counter()
+    baseline = simulate({}, num_games, seed=0)
+    print(f"baseline, {num_games} games in {time.perf_counter() - start:.2f}s")
+    print("path sizes: " + ", ".join(f"{size}: {p:.4f}" for size, p in baseline["path_sizes"].items()))
+    print_summary(baseline)
+
+    configs = create_configs(target_path_size=[8, 9, 10, 11, 12],
+                             player=[{"wrong_prob": 0.05}, {"wrong_prob": 0.1}, {"wrong_prob": 0.2}])
+    start = time.perf_counter()
+    results = sweep(configs, num_games)
+    print(f"sweep of {len(configs)} configurations in {time.perf_counter() - start:.2f}s")
+    for summary in results:
+        print_summary(summary)
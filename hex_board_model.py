@@ -1,31 +1,37 @@
 import parameters as param
 import cv2
 import numpy as np
+import os
 import math
+import hashlib
+import zipfile
 import logging
 from svg_parse import parse_svg_to_polylines
+from board_geometry import BoardGeometry
 
 logger = logging.getLogger(__name__)
 
 
 class HexBoardModel:
-    def __init__(self, svg_file, center_offset, cam_pos):
+    OFF_BOARD = 255  # label of the pixels outside of every hexagon
+    geometries = {}  # BoardGeometry per (svg_file, center_offset), shared by the models of both cameras
+
+    def __init__(self, svg_file, center_offset, cam_pos, frame_size=(1280, 720)):
+        self.frame_size = frame_size
+        self.label_image = None
+        self.overlays = {}  # prerendered lines, see get_overlay
+        self.image_vertices = None  # vertices of the geometry projected onto the camera frame
         self.pers_polygons = None
         self.floor_quad = None
+        self.board_roi = None
+        self.homography = None      # board plane -> camera frame
+        self.inv_homography = None  # camera frame -> board plane
         self.cam_pos = cam_pos
-        unsorted_hexagons = self.load_hexagons(svg_file, center_offset)
-        self.hexagons = self.sort_hexes(unsorted_hexagons, 5)
-        self.hex_coordinates = self.create_hex_coordinates()
-
-        ibw = 721/10
-        ibh = 1868/10
-        hibw = ibw / 2
-        hibh = ibh / 2
-
-        self.bounds = np.array([[[-hibw, -hibh],
-                                 [ hibw, -hibh],
-                                 [ hibw,  hibh],
-                                 [-hibw,  hibh]]], dtype=np.float32)
+        self.radius_scale_map = self.create_radius_scale_map(frame_size, cam_pos) if param.BALL_RADIUS_SCALE_MAP else None
+        self.geometry = self.get_board_geometry(svg_file, center_offset)
+        self.hexagons = self.geometry.hexagons
+        self.hex_coordinates = self.geometry.hex_coordinates
+        self.bounds = self.geometry.bounds
 
     def get_polygon_under_ball(self, ball_bbox):
         #x1, y1, x2, y2 = ball_bbox
@@ -33,9 +39,34 @@ class HexBoardModel:
         #ball_pos = (x1, y2)
         ball_pos = self.ellipse_line_intersection(ball_bbox, self.cam_pos)
 
-        idx, enabled_polygon = self.find_polygon_contains_point(self.pers_polygons, ball_pos)
+        if param.HEX_LOOKUP_BOARD_PLANE:
+            idx = self.find_hex_at_board_point(self.image_to_board(ball_pos))
+        else:
+            idx = self.find_hex_index(ball_pos)
+        enabled_polygon = self.pers_polygons[idx] if idx >= 0 else None
         return idx, enabled_polygon, ball_pos
 
+    def get_hexes_under_balls(self, ball_bboxes):
+        """
+        Vectorized get_polygon_under_ball for several boxes of the same camera.
+
+        Parameters:
+            ball_bboxes (np.ndarray): (N, 4) boxes (x1, y1, x2, y2).
+
+        Returns:
+            tuple: ((N,) hexagon indices, -1 outside of the board, (N, 2) contact points in the frame).
+        """
+        ball_positions = self.ellipse_line_intersections(ball_bboxes, self.cam_pos)
+        if len(ball_positions) == 0:
+            return np.zeros(0, dtype=np.int64), ball_positions
+
+        if param.HEX_LOOKUP_BOARD_PLANE:
+            board_points = self.image_to_board_points(ball_positions)
+            indices = self.find_hexes_at_board_points(board_points)
+        else:
+            indices = self.find_hex_indices(ball_positions)
+        return indices, ball_positions
+
     def get_hex_under_ball(self, ball_bbox):
         idx, enabled_polygon, _ = self.get_polygon_under_ball(ball_bbox)
         if enabled_polygon is None:
@@ -47,19 +78,241 @@ class HexBoardModel:
 
     def set_calibration_points(self, floor_quad):
         self.floor_quad = floor_quad
-        self.pers_polygons = HexBoardModel.create_perspective_polygons(self.floor_quad, self.bounds, self.hexagons)
+        self.homography = cv2.getPerspectiveTransform(self.bounds[0], np.array(floor_quad, dtype=np.float32))
+        self.inv_homography = np.linalg.inv(self.homography)
+
+        # one transform for the vertices of all hexagons, truncated like create_perspective_polygon
+        self.image_vertices = cv2.perspectiveTransform(self.geometry.vertices[np.newaxis], self.homography)[0]
+        self.image_vertices = self.image_vertices.astype(np.int32)
+        self.pers_polygons = self.geometry.split(self.image_vertices)
+        self.board_roi = HexBoardModel.calculate_board_roi(self.image_vertices, param.ROI_MARGIN)
+        self.label_image = HexBoardModel.create_label_image(self.pers_polygons, self.frame_size)
+        self.overlays = {}
         for i in range(len(self.pers_polygons)):
             logger.debug(f"{i:02d} - {self.hex_coordinates[i]} - Pers:{len(self.pers_polygons[i])}:{self.pers_polygons[i]} - Hex:{len(self.hexagons[i])}:{self.hexagons[i]}")
 
-    def draw_hexagons(self, frame, color=(255, 0, 0)):
-        self.draw_perspective_polygons(frame, self.floor_quad, self.bounds, self.hexagons, color)
+    def find_hex_index(self, point):
+        """
+        Returns the index of the hexagon under a point of the camera frame or -1.
+        """
+        x, y = int(point[0]), int(point[1])
+        height, width = self.label_image.shape
+        if x < 0 or y < 0 or x >= width or y >= height:
+            return -1
+
+        label = self.label_image[y, x]
+        return int(label) if label != self.OFF_BOARD else -1
+
+    def find_hex_indices(self, points):
+        """
+        Vectorized find_hex_index for an (N, 2) array of points of the camera frame.
+
+        Returns:
+            np.ndarray: (N,) hexagon indices, -1 for points outside of the board.
+        """
+        points = np.asarray(points).reshape(-1, 2).astype(np.int64)
+        height, width = self.label_image.shape
+        x, y = points[:, 0], points[:, 1]
+        inside = (x >= 0) & (y >= 0) & (x < width) & (y < height)
+
+        result = np.full(len(points), -1, dtype=np.int64)
+        labels = self.label_image[y[inside], x[inside]].astype(np.int64)
+        labels[labels == self.OFF_BOARD] = -1
+        result[inside] = labels
+        return result
+
+    def image_to_board(self, point):
+        """
+        Projects a point of the camera frame onto the board plane (the coordinates of self.hexagons).
+        """
+        np_point = np.array([[point]], dtype=np.float32)
+        board_point = cv2.perspectiveTransform(np_point, self.inv_homography)[0][0]
+        return float(board_point[0]), float(board_point[1])
+
+    def image_to_board_points(self, points):
+        """
+        Vectorized image_to_board for an (N, 2) array of points.
+        """
+        np_points = np.asarray(points, dtype=np.float32).reshape(1, -1, 2)
+        return cv2.perspectiveTransform(np_points, self.inv_homography)[0]
+
+    def board_to_image(self, board_point):
+        """
+        Projects a point of the board plane onto the camera frame.
+        """
+        np_point = np.array([[board_point]], dtype=np.float32)
+        point = cv2.perspectiveTransform(np_point, self.homography)[0][0]
+        return float(point[0]), float(point[1])
+
+    def find_hex_at_board_point(self, board_point):
+        """
+        Returns the index of the hexagon containing the board point or -1.
+        """
+        return self.geometry.find_hex_at_board_point(board_point)
+
+    def find_hexes_at_board_points(self, board_points):
+        """
+        Vectorized find_hex_at_board_point for an (N, 2) array of board points.
+        """
+        return self.geometry.find_hexes_at_board_points(board_points)
+
+    def draw_hexagons(self, frame, color=(255, 0, 0), thickness=2):
+        self.draw_overlay(frame, None, color, thickness)
+
+    def draw_hexagon(self, frame, idx, color=(255, 0, 0), thickness=2):
+        self.draw_overlay(frame, idx, color, thickness)
+
+    def draw_overlay(self, frame, idx, color, thickness):
+        if frame.shape[1::-1] != tuple(self.frame_size):
+            # the overlays are prerendered for the calibrated frame size only
+            polygons = self.pers_polygons if idx is None else [self.pers_polygons[idx]]
+            self.draw_polygons(frame, polygons, color, thickness)
+            return
+
+        HexBoardModel.composite_overlay(frame, self.get_overlay(idx, color, thickness))
+
+    def get_overlay(self, idx, color, thickness):
+        """
+        Returns the lines of all hexagons (idx None) or of one hexagon, rendered once per calibration
+        and color.
+        """
+        key = (idx, tuple(color), thickness)
+        if key not in self.overlays:
+            polygons = self.pers_polygons if idx is None else [self.pers_polygons[idx]]
+            self.overlays[key] = HexBoardModel.render_overlay(polygons, self.frame_size, color, thickness)
+        return self.overlays[key]
+
+    @staticmethod
+    def render_overlay(polygons, frame_size, color, thickness):
+        """
+        Renders the polygon lines into a layer and a mask, both cropped to the bounding box of the lines.
+
+        Returns:
+            tuple: (x, y, layer, mask) where (x, y) is the position of the crop in the frame.
+        """
+        width, height = frame_size
+        np_polygons = [np.array(polygon, dtype=np.int32) for polygon in polygons]
+        layer = np.zeros((height, width, 3), dtype=np.uint8)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.polylines(layer, np_polygons, isClosed=True, color=color, thickness=thickness)
+        cv2.polylines(mask, np_polygons, isClosed=True, color=255, thickness=thickness)
+
+        x, y, w, h = cv2.boundingRect(mask)
+        return x, y, layer[y:y+h, x:x+w].copy(), mask[y:y+h, x:x+w, np.newaxis] > 0
+
+    @staticmethod
+    def composite_overlay(frame, overlay):
+        x, y, layer, mask = overlay
+        h, w = mask.shape[:2]
+        np.copyto(frame[y:y+h, x:x+w], layer, where=mask)
+
+    @staticmethod
+    def get_board_geometry(svg_file, center_offset):
+        """
+        Returns the BoardGeometry of the SVG file, parsing it only the first time. With
+        param.HEXAGONS_GEOMETRY_CACHE the parsed geometry is also kept on disk (see load_cached_geometry).
+        """
+        key = (svg_file, tuple(center_offset))
+        if key not in HexBoardModel.geometries:
+            if param.HEXAGONS_GEOMETRY_CACHE:
+                geometry = HexBoardModel.load_cached_geometry(svg_file, center_offset,
+                                                              param.HEXAGONS_SVG_SAMPLE_INTERVAL)
+            else:
+                geometry = HexBoardModel.create_board_geometry(svg_file, center_offset,
+                                                               param.HEXAGONS_SVG_SAMPLE_INTERVAL)
+            logger.debug(f"Board geometry of {svg_file}: {len(geometry)} hexagons, {geometry.memory_size()} bytes")
+            HexBoardModel.geometries[key] = geometry
+        return HexBoardModel.geometries[key]
+
+    @staticmethod
+    def create_board_geometry(svg_file, center_offset, sample_interval):
+        unsorted_hexagons = HexBoardModel.load_hexagons(svg_file, center_offset, sample_interval)
+        hexagons = HexBoardModel.sort_hexes(unsorted_hexagons, 5)
+        return BoardGeometry(hexagons, HexBoardModel.create_hex_coordinates(), HexBoardModel.create_bounds())
+
+    @staticmethod
+    def load_cached_geometry(svg_file, center_offset, sample_interval):
+        """
+        Loads the geometry from <svg_file>.geometry.npz, or parses the SVG and writes that file when it
+        doesn't exist or was created from a different SVG, offset or sample interval.
+        """
+        cache_file = svg_file + ".geometry.npz"
+        with open(svg_file, 'rb') as f:
+            svg_hash = hashlib.sha256(f.read()).hexdigest()
+        cache_key = f"{svg_hash}|{float(center_offset[0])},{float(center_offset[1])}|{float(sample_interval)}"
+
+        if os.path.exists(cache_file):
+            try:
+                geometry = BoardGeometry.load(cache_file, cache_key)
+                if geometry is not None:
+                    return geometry
+                logger.info(f"{cache_file} is stale, rebuilding it")
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                logger.warning(f"Failed to load {cache_file}, rebuilding it: {e}")
+
+        geometry = HexBoardModel.create_board_geometry(svg_file, center_offset, sample_interval)
+        try:
+            geometry.save(cache_file, cache_key)
+        except OSError as e:
+            logger.warning(f"Failed to write {cache_file}: {e}")
+        return geometry
+
+    @staticmethod
+    def create_bounds():
+        ibw = 721/10
+        ibh = 1868/10
+        hibw = ibw / 2
+        hibh = ibh / 2
+
+        return np.array([[[-hibw, -hibh],
+                          [ hibw, -hibh],
+                          [ hibw,  hibh],
+                          [-hibw,  hibh]]], dtype=np.float32)
 
     @staticmethod
-    def load_hexagons(svg_file, center_offset):
-        result = parse_svg_to_polylines(svg_file, offset=center_offset)
+    def load_hexagons(svg_file, center_offset, sample_interval=100000.0):
+        result = parse_svg_to_polylines(svg_file, offset=center_offset, sample_interval=sample_interval)
         result = [HexBoardModel.remove_consecutive_duplicates(polygon) for polygon in result]
         return result
 
+    @staticmethod
+    def calculate_board_roi(points, margin):
+        """
+        Calculates the region of the frame covered by the board.
+
+        Parameters:
+            points (np.ndarray): (N, 2) vertices of the perspective polygons of the board.
+            margin (tuple): (horizontal, top, bottom) margin in pixels. The top margin should fit a ball
+                            standing on the farthest hexagons.
+
+        Returns:
+            tuple: (x1, y1, x2, y2) bounding rectangle of the polygons with the margin (not clipped to the frame).
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        x1, y1 = points.min(axis=0)
+        x2, y2 = points.max(axis=0)
+        margin_x, margin_top, margin_bottom = margin
+        return int(x1 - margin_x), int(y1 - margin_top), int(x2 + margin_x), int(y2 + margin_bottom)
+
+    @staticmethod
+    def create_label_image(polygons, frame_size):
+        """
+        Rasterizes the polygons into an image where each pixel holds the index of its polygon
+        (OFF_BOARD outside of all of them), so finding the polygon under a point is a single lookup.
+
+        Parameters:
+            polygons (list): The perspective polygons, at most 255.
+            frame_size (tuple): (width, height) of the camera frame.
+        """
+        width, height = frame_size
+        label_image = np.full((height, width), HexBoardModel.OFF_BOARD, dtype=np.uint8)
+
+        # in reverse so that, where polygons overlap, the first one wins like in find_polygon_contains_point
+        for idx in reversed(range(len(polygons))):
+            cv2.fillPoly(label_image, [np.array(polygons[idx], dtype=np.int32)], idx)
+
+        return label_image
+
     @staticmethod
     def calculate_floor_quad(bboxes):
         result = []
@@ -232,6 +485,54 @@ class HexBoardModel:
         #return dist * 0.000875 - 0.085
         return dist * 0.00125 - 0.55
 
+    @staticmethod
+    def create_radius_scale_map(frame_size, cam_pos):
+        """
+        Precomputes dynamic_radius_scale for the distance of every pixel of the frame to the camera position.
+        """
+        width, height = frame_size
+        xs = np.arange(width, dtype=np.float32) - cam_pos[0]
+        ys = np.arange(height, dtype=np.float32) - cam_pos[1]
+        distances = np.sqrt(xs[np.newaxis, :] ** 2 + ys[:, np.newaxis] ** 2)
+        return HexBoardModel.dynamic_radius_scale(distances).astype(np.float32)
+
+    def radius_scales(self, cx, cy, external_point):
+        """
+        Radius scale of ellipses centered at (cx, cy), scalars or arrays, from the map when there is one.
+        """
+        if self.radius_scale_map is None:
+            px, py = external_point
+            return self.dynamic_radius_scale(np.sqrt((px - cx) ** 2 + (py - cy) ** 2))
+
+        height, width = self.radius_scale_map.shape
+        x = np.clip(np.asarray(cx, dtype=np.int64), 0, width - 1)
+        y = np.clip(np.asarray(cy, dtype=np.int64), 0, height - 1)
+        return self.radius_scale_map[y, x]
+
+    def ellipse_line_intersections(self, bboxes, external_point):
+        """
+        Vectorized ellipse_line_intersection for an (N, 4) array of boxes.
+
+        Returns:
+            np.ndarray: (N, 2) intersection points. Boxes centered at the external point return their center.
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        px, py = external_point
+
+        cx = (bboxes[:, 0] + bboxes[:, 2]) / 2
+        cy = (bboxes[:, 1] + bboxes[:, 3]) / 2
+        radius_scale = self.radius_scales(cx, cy, external_point)
+        rx = (bboxes[:, 2] - bboxes[:, 0]) / 2 * radius_scale
+        ry = (bboxes[:, 3] - bboxes[:, 1]) / 2 * radius_scale
+
+        dx = px - cx
+        dy = py - cy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = 1.0 / np.sqrt((dx ** 2) / rx ** 2 + (dy ** 2) / ry ** 2)
+        scale = np.nan_to_num(scale, nan=0.0, posinf=0.0)
+
+        return np.column_stack([cx + dx * scale, cy + dy * scale])
+
     def ellipse_line_intersection(self, bbox, external_point):
         x_min, y_min, x_max, y_max = bbox
         px, py = external_point
@@ -240,7 +541,10 @@ class HexBoardModel:
         cx = (x_min + x_max) / 2
         cy = (y_min + y_max) / 2
 
-        radius_scale = self.dynamic_radius_scale(self.distance(px, py, cx, cy))
+        if self.radius_scale_map is None:
+            radius_scale = self.dynamic_radius_scale(self.distance(px, py, cx, cy))
+        else:
+            radius_scale = float(self.radius_scales(cx, cy, external_point))
 
         # Compute radii
         rx = (x_max - x_min) / 2 * radius_scale
@@ -265,9 +569,68 @@ class HexBoardModel:
         return ix, iy
 
 
-if __name__ == "__main__":
-    import parameters as param
-    hex_model = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(0, 0))
+def benchmark_hex_lookup(num_points=10000):
+    """
+    Compares finding the hexagon under points with ray casting over all polygons and with the label image.
+    """
+    import time
 
-    hex_model
+    hex_model = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(0, 1440))
+    hex_model.set_calibration_points([(420, 80), (860, 80), (1180, 700), (100, 700)])
+
+    rng = np.random.default_rng(0)
+    points = np.column_stack([rng.uniform(0, 1280, num_points), rng.uniform(0, 720, num_points)])
+
+    start = time.perf_counter()
+    ray_casting = [HexBoardModel.find_polygon_contains_point(hex_model.pers_polygons, point)[0] for point in points]
+    ray_casting_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raster = [hex_model.find_hex_index(point) for point in points]
+    raster_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = hex_model.find_hex_indices(points)
+    batch_time = time.perf_counter() - start
+
+    # points exactly on the border of a polygon may fall on different sides
+    agreement = np.mean(np.array(ray_casting) == np.array(raster))
+    print(f"ray casting: {ray_casting_time / num_points * 1e6:8.2f}us/point")
+    print(f"label image: {raster_time / num_points * 1e6:8.2f}us/point")
+    print(f"batch:       {batch_time / num_points * 1e6:8.2f}us/point")
+    print(f"agreement: {agreement:.4f}, batch matches single lookups: {np.array_equal(batch, raster)}")
+
+
+def benchmark_contact_points(num_boxes=1000):
+    """
+    Compares the contact point of the ball box by box and for all boxes in one call.
+    """
+    import time
+
+    hex_model = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(0, 1440))
+    hex_model.set_calibration_points([(420, 80), (860, 80), (1180, 700), (100, 700)])
+
+    rng = np.random.default_rng(0)
+    centers = np.column_stack([rng.uniform(0, 1280, num_boxes), rng.uniform(0, 720, num_boxes)])
+    sizes = rng.uniform(20, 80, (num_boxes, 1))
+    bboxes = np.hstack([centers - sizes / 2, centers + sizes / 2])
+
+    start = time.perf_counter()
+    single = [hex_model.get_polygon_under_ball(bbox) for bbox in bboxes]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indices, positions = hex_model.get_hexes_under_balls(bboxes)
+    batch_time = time.perf_counter() - start
+
+    max_diff = np.abs(positions - np.array([ball_pos for _, _, ball_pos in single])).max()
+    agreement = np.mean(indices == np.array([idx for idx, _, _ in single]))
+    print(f"single: {single_time / num_boxes * 1e6:8.2f}us/box")
+    print(f"batch:  {batch_time / num_boxes * 1e6:8.2f}us/box")
+    print(f"max contact point difference: {max_diff:.6f}px, hexagon agreement: {agreement:.4f}")
+
+
+if __name__ == "__main__":
+    benchmark_hex_lookup()
+    benchmark_contact_points()
 
@@ -15,8 +15,24 @@ class HexNode:
 
 
 class HexGraph:
-    def __init__(self):
+    # (delta col, delta row, weight) of the links of each column, on even and odd rows
+    EVEN_LINKS = [
+        [(1, 0, .2), (0, 1, .4), (1, 1, .4)],
+        [(-1, 0, .2), (0, 1, .4), (1, 1, .4)]]
+    ODD_LINKS = [
+        [(1, 0, .2), (0, 1, .8)],
+        [(-1, 0, .1), (1, 0, .1), (-1, 1, .4), (0, 1, .4)],
+        [(-1, 0, .2), (-1, 1, .8)]]
+
+    def __init__(self, even_links=None, odd_links=None):
+        """
+        :param even_links: Links of the even rows, replaces EVEN_LINKS (used to tune the weights).
+        :param odd_links: Links of the odd rows, replaces ODD_LINKS.
+        """
         self.nodes = {}  # key: (col, row), value: HexNode
+        self.even_links = even_links or self.EVEN_LINKS
+        self.odd_links = odd_links or self.ODD_LINKS
+        self.length_distributions = {}  # key: walk state, value: {path size: probability}, see get_length_distribution
         self.build_graph()
 
     def add_node(self, col, row):
@@ -45,19 +61,11 @@ class HexGraph:
             for col in range(num_cols):
                 self.add_node(col, row)
 
-        even = [
-            [(1, 0, .2), (0, 1, .4), (1, 1, .4)],
-            [(-1, 0, .2), (0, 1, .4), (1, 1, .4)]]
-        odd = [
-            [(1, 0, .2), (0, 1, .8)],
-            [(-1, 0, .1), (1, 0, .1), (-1, 1, .4), (0, 1, .4)],
-            [(-1, 0, .2), (-1, 1, .8)]]
-
         for row in range(8-1):
             num_cols = 3 if row % 2 == 1 else 2
             for col in range(num_cols):
                 source_node = (col, row)
-                links = odd if row % 2 == 1 else even
+                links = self.odd_links if row % 2 == 1 else self.even_links
                 for idx, link in enumerate(links[col]):
                     # don't go to the side on the first row
                     if row == 0 and idx == 0:
@@ -83,6 +91,38 @@ class HexGraph:
         return result
 
     def create_random_path_target_size(self, start_node_col, target_size):
+        """
+        Creates a random path with exactly target_size nodes, with the same distribution as calling
+        create_random_path until it returns a path of that size, but drawing it in a single pass.
+        """
+        node = self.get_node(start_node_col, 0)
+
+        if not node:
+            raise ValueError("start node not found")
+
+        state = (node, frozenset([node]))
+        if self.get_length_distribution(state).get(target_size, 0.0) == 0.0:
+            raise ValueError(f"There is no path of size {target_size} from column {start_node_col}")
+
+        visited_nodes = [node]
+        remaining = target_size
+        while remaining > 1:
+            # each step is weighted by the probability of still finishing with the target size
+            next_states = []
+            weights = []
+            for next_state, probability in self.get_transitions(state):
+                weight = probability * self.get_length_distribution(next_state).get(remaining - 1, 0.0)
+                if weight > 0:
+                    next_states.append(next_state)
+                    weights.append(weight)
+
+            state = random.choices(next_states, weights=weights, k=1)[0]
+            visited_nodes.append(state[0])
+            remaining -= 1
+
+        return [(node.col, node.row) for node in visited_nodes]
+
+    def create_random_path_by_rejection(self, start_node_col, target_size):
         size = 0
         path = None
         while size != target_size:
@@ -91,6 +131,88 @@ class HexGraph:
 
         return path
 
+    @staticmethod
+    def get_transitions(state):
+        """
+        Returns the next states of a walk of create_random_path and their probabilities.
+
+        A state is (node, visited nodes of the node's row): links only go sideways or to the next row,
+        so those are the only visited nodes that choose_next_node can find among the neighbors.
+        """
+        node, visited_in_row = state
+        unvisited_links = [(neighbor, weight) for neighbor, weight in node.links if neighbor not in visited_in_row]
+        total_weight = sum(weight for _, weight in unvisited_links)
+
+        transitions = []
+        for neighbor, weight in unvisited_links:
+            if neighbor.row == node.row:
+                next_state = (neighbor, visited_in_row | {neighbor})
+            else:
+                next_state = (neighbor, frozenset([neighbor]))
+            transitions.append((next_state, weight / total_weight))
+        return transitions
+
+    def get_length_distribution(self, state):
+        """
+        Returns {size: probability} of the size of the rest of the path (including the state's node)
+        of a walk of create_random_path from the state. Calculated by dynamic programming, once per state.
+        """
+        if state not in self.length_distributions:
+            node, _ = state
+            if len(node.links) == 0:
+                distribution = {1: 1.0}
+            else:
+                distribution = {}
+                for next_state, probability in self.get_transitions(state):
+                    for size, size_probability in self.get_length_distribution(next_state).items():
+                        distribution[size + 1] = distribution.get(size + 1, 0.0) + probability * size_probability
+            self.length_distributions[state] = distribution
+
+        return self.length_distributions[state]
+
+    def get_path_size_distribution(self, start_node_col):
+        """
+        Returns {size: probability} of the size of the paths of create_random_path.
+        """
+        node = self.get_node(start_node_col, 0)
+        return dict(sorted(self.get_length_distribution((node, frozenset([node]))).items()))
+
+    def get_all_paths(self, start_node_col, target_size):
+        """
+        Returns every path (a tuple of (col, row)) of create_random_path with target_size nodes.
+        """
+        node = self.get_node(start_node_col, 0)
+        paths = []
+
+        def visit(state, path):
+            if len(path) == target_size:
+                if len(state[0].links) == 0:
+                    paths.append(tuple(path))
+                return
+            for next_state, _ in self.get_transitions(state):
+                if self.get_length_distribution(next_state).get(target_size - len(path), 0.0) > 0:
+                    visit(next_state, path + [(next_state[0].col, next_state[0].row)])
+
+        visit((node, frozenset([node])), [(node.col, node.row)])
+        return paths
+
+    def get_path_probability(self, path):
+        """
+        Returns the probability of create_random_path returning the path (a list of (col, row)).
+        """
+        node = self.get_node(*path[0])
+        state = (node, frozenset([node]))
+        probability = 1.0
+        for coord in path[1:]:
+            transitions = {next_state[0]: (next_state, p) for next_state, p in self.get_transitions(state)}
+            next_node = self.get_node(*coord)
+            if next_node not in transitions:
+                return 0.0
+            state, p = transitions[next_node]
+            probability *= p
+
+        return probability if len(state[0].links) == 0 else 0.0
+
     @staticmethod
     def choose_next_node(current_node, visited_nodes):
         unvisited_links = [
@@ -109,7 +231,68 @@ class HexGraph:
         return f"HexGraph with {len(self.nodes)} nodes"
 
 
+def benchmark_path_sampler(target_size=9, num_paths=2000):
+    """
+    Compares the time to create paths of a given size by rejection and with the exact size sampler.
+    """
+    import time
+
+    graph = HexGraph()
+    graph.create_random_path_target_size(0, target_size)  # builds the length distributions
+
+    for name, create_path in (("rejection", graph.create_random_path_by_rejection),
+                              ("exact size", graph.create_random_path_target_size)):
+        start = time.perf_counter()
+        for i in range(num_paths):
+            create_path(i % 2, target_size)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10}: {elapsed / num_paths * 1e6:8.2f}us/path")
+
+    for start_col in range(2):
+        sizes = ", ".join(f"{size}: {p:.4f}" for size, p in graph.get_path_size_distribution(start_col).items())
+        print(f"path sizes from column {start_col}: {sizes}")
+
+
+def test_path_sampler_distribution(target_size=9, num_paths=20000, seed=0):
+    """
+    Checks that the exact size sampler and the rejection loop draw the paths with the expected
+    probabilities (the probability of the path in create_random_path, conditioned on its size),
+    with a chi-squared test on the frequency of each path.
+    """
+    import math
+    from collections import Counter
+
+    random.seed(seed)
+    graph = HexGraph()
+    for start_col in range(2):
+        size_probability = graph.get_path_size_distribution(start_col)[target_size]
+
+        for name, create_path in (("rejection", graph.create_random_path_by_rejection),
+                                  ("exact size", graph.create_random_path_target_size)):
+            counts = Counter(tuple(create_path(start_col, target_size)) for _ in range(num_paths))
+
+            paths = graph.get_all_paths(start_col, target_size)
+            assert set(counts) <= set(paths), f"{name} sampler drew an invalid path"
+
+            chi2 = 0.0
+            for path in paths:
+                expected = graph.get_path_probability(list(path)) / size_probability * num_paths
+                chi2 += (counts[path] - expected) ** 2 / expected
+
+            dof = len(paths) - 1
+            limit = dof + 4 * math.sqrt(2 * dof)  # about 4 standard deviations
+            print(f"column {start_col} {name:<10}: {len(paths)} paths, chi2 {chi2:.1f} (limit {limit:.1f})")
+            assert chi2 < limit, f"{name} sampler doesn't match the expected distribution"
+
+
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark_path_sampler()
+        test_path_sampler_distribution()
+        exit(0)
+
     graph = HexGraph()
 
     for _ in range(10):
@@ -1,20 +1,130 @@
-from arduino_serial_sender import ArduinoSerialSender, DummyArduinoSerialSender
+import threading
+from arduino_serial_sender import ArduinoSerialSender, DummyArduinoSerialSender, BOARD_CELLS, CMD_SET_FRAME
 import parameters as param
 
 
 class HexagonsBoard:
+    """
+    LEDs of the board. The board keeps a copy of the color of every cell (the hexagons and the goal), so
+    setting a cell to the color it already has doesn't send anything.
+
+    Between begin_frame and flush the changes are only recorded, and flush sends the cells that changed
+    with a single write. Outside of a frame every change is sent immediately. set_cells is used by the
+    LED animations, from their own thread, and is always sent immediately.
+    """
+    GOAL = BOARD_CELLS[-1]
+    BLACK = (0, 0, 0)
+
     def __init__(self, port, baudrate):
-        self.sender = ArduinoSerialSender(port, baudrate, sender_delay=param.ARDUINO_SENDER_DELAY) if param.DUMMY_ARDUINO == 0 \
+        self.sender = ArduinoSerialSender(port, baudrate, sender_delay=param.ARDUINO_SENDER_DELAY,
+                                          async_mode=param.ARDUINO_ASYNC_SENDER == 1,
+                                          bulk_protocol=param.ARDUINO_BULK_PROTOCOL == 1) if param.DUMMY_ARDUINO == 0 \
             else DummyArduinoSerialSender()
 
+        self.cells = list(BOARD_CELLS)
+        self.colors = {cell: self.BLACK for cell in self.cells}  # colors set by the game
+        self.sent_colors = {cell: None for cell in self.cells}   # colors on the LEDs, None if unknown
+        self.dirty = []  # cells changed since the last flush, in order
+        self.clear_pending = False
+        self.buffering = False
+        self.lock = threading.RLock()
+
+        self.packets_sent = 0
+        self.writes = 0
+        self.unchanged = 0  # changes that were not sent because the cell already had the color
+
+    def begin_frame(self):
+        """
+        Records the changes until flush is called.
+        """
+        self.buffering = param.LED_FRAME_BUFFER == 1
+
     def set_hexagon(self, col, row, color):
-        self.sender.send_bytes(1, col, row, *color)
+        self.set_cell((col, row), tuple(color))
 
     def set_goal(self, color):
-        self.sender.send_bytes(2, *color, 0, 0)
+        self.set_cell(self.GOAL, tuple(color))
 
     def clear(self):
-        self.sender.send_bytes(0, 0, 0, 0, 0, 0)
+        with self.lock:
+            for cell in self.cells:
+                self.colors[cell] = self.BLACK
+            self.clear_pending = True
+            self.flush_if_not_buffering()
+
+    def set_cell(self, cell, color):
+        with self.lock:
+            self.colors[cell] = color
+            if cell not in self.dirty:
+                self.dirty.append(cell)
+            self.flush_if_not_buffering()
+
+    def set_cells(self, colors):
+        """
+        Sets several cells ({cell: color}) and sends them right away, even inside a frame.
+        """
+        with self.lock:
+            for cell, color in colors.items():
+                self.colors[cell] = tuple(color)
+                if cell not in self.dirty:
+                    self.dirty.append(cell)
+            self.flush(list(colors))
+
+    def flush_if_not_buffering(self):
+        if not self.buffering:
+            self.flush()
+
+    def flush(self, cells=None):
+        """
+        Sends the cells whose color is different from the one on the LEDs, and ends the frame.
+
+        :param cells: Sends only these cells, without ending the frame.
+        """
+        with self.lock:
+            packets = []
+            if cells is None:
+                self.buffering = False
+
+                # a single clear packet when it turns off more than one cell
+                if self.clear_pending:
+                    lit = [cell for cell in self.cells if self.sent_colors[cell] != self.BLACK]
+                    if len(lit) > 1:
+                        packets.append((0, 0, 0, 0, 0, 0))
+                        for cell in self.cells:
+                            self.sent_colors[cell] = self.BLACK
+                        lit = []
+                    # turned off by the clear, then set again (e.g. by an animation) before the flush
+                    lit += [cell for cell in self.cells if self.colors[cell] != self.BLACK]
+                    self.dirty += [cell for cell in lit if cell not in self.dirty]
+                    self.clear_pending = False
+
+                cells = self.dirty
+                self.dirty = []
+            else:
+                self.dirty = [cell for cell in self.dirty if cell not in cells]
+
+            for cell in cells:
+                color = self.colors[cell]
+                if self.sent_colors[cell] == color:
+                    self.unchanged += 1
+                    continue
+                packets.append((2, *color, 0, 0) if cell == self.GOAL else (1, *cell, *color))
+                self.sent_colors[cell] = color
+
+            # with the bulk protocol, many changes go in one full board frame
+            if param.ARDUINO_BULK_PROTOCOL == 1 and len(packets) > len(self.cells) // 2:
+                packets = [(CMD_SET_FRAME, *[b for cell in self.cells for b in self.colors[cell]])]
+                for cell in self.cells:
+                    self.sent_colors[cell] = self.colors[cell]
+
+            if packets:
+                self.sender.send_packets(packets)
+                self.packets_sent += len(packets)
+                self.writes += 1
+
+    def get_stats(self):
+        return {"packets_sent": self.packets_sent, "writes": self.writes, "unchanged": self.unchanged,
+                **self.sender.get_stats()}
 
 
 # Example Usage
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import logging
+import numpy as np
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBackend:
+    """
+    Describes how a YOLO .pt model is exported and loaded to run on a given runtime.
+
+    The exported model is loaded through ultralytics, so every backend returns the same results
+    (result.boxes.xyxy/conf/cls) and YoloObjectDetector doesn't need to know which one is in use.
+    """
+    def __init__(self, name, export_format, suffix, dynamic=True, dnn=False, supports_int8=False):
+        self.name = name
+        self.export_format = export_format
+        self.suffix = suffix
+        self.dynamic = dynamic  # dynamic batch and input size (needed by the batched, ROI and tracking modes)
+        self.dnn = dnn
+        self.supports_int8 = supports_int8
+
+    def exported_path(self, model_path, int8=False):
+        if self.export_format is None:
+            return model_path
+
+        base, _ = os.path.splitext(model_path)
+        return f"{base}{'_int8' if int8 else ''}{self.suffix}"
+
+    def export(self, model_path, int8=False, imgsz=640, data=None):
+        """
+        Exports the model if it wasn't exported yet and returns the path of the exported model.
+
+        :param data: Dataset yaml used to calibrate the OpenVINO INT8 quantization.
+        """
+        if self.export_format is None:
+            return model_path
+
+        if int8 and not self.supports_int8:
+            raise ValueError(f"Backend {self.name} doesn't support INT8 weights")
+
+        path = self.exported_path(model_path, int8)
+        if os.path.exists(path):
+            return path
+
+        logger.info(f"Exporting {model_path} to {path}")
+        if int8 and self.export_format == "onnx":
+            # ultralytics doesn't quantize ONNX models, so the weights are quantized by onnxruntime
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            float_path = self.export(model_path, int8=False, imgsz=imgsz)
+            quantize_dynamic(float_path, path, weight_type=QuantType.QUInt8)
+            return path
+
+        # ultralytics always writes <model>.onnx, don't lose another backend's export of the same model
+        default_onnx = os.path.splitext(model_path)[0] + ".onnx"
+        keep_default_onnx = self.export_format == "onnx" and path != default_onnx and os.path.exists(default_onnx)
+        if keep_default_onnx:
+            os.replace(default_onnx, default_onnx + ".bak")
+
+        export_args = {"format": self.export_format, "imgsz": imgsz, "dynamic": self.dynamic}
+        if int8:
+            if data is not None and not os.path.exists(data):
+                logger.warning(f"INT8 calibration dataset {data} not found, using the ultralytics default")
+                data = None
+            export_args.update({"int8": True, "data": data})
+        exported = YOLO(model_path).export(**export_args)
+
+        if os.path.abspath(exported) != os.path.abspath(path):
+            os.replace(exported, path)
+        if keep_default_onnx:
+            os.replace(default_onnx + ".bak", default_onnx)
+
+        return path
+
+    def load(self, model_path, int8=False, data=None):
+        return YOLO(self.export(model_path, int8, data=data), task="detect")
+
+    def predict_args(self):
+        return {"dnn": True} if self.dnn else {}
+
+
+BACKENDS = {
+    "torch": InferenceBackend("torch", None, ".pt"),
+    "onnx": InferenceBackend("onnx", "onnx", ".onnx", supports_int8=True),
+    "openvino": InferenceBackend("openvino", "openvino", "_openvino_model", supports_int8=True),
+    # OpenCV DNN only handles static shapes
+    "opencv": InferenceBackend("opencv", "onnx", "_static.onnx", dynamic=False, dnn=True),
+}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Invalid inference backend: {name}. Options: {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def box_iou(box1, box2):
+    x1 = max(box1[0], box2[0])
+    y1 = max(box1[1], box2[1])
+    x2 = min(box1[2], box2[2])
+    y2 = min(box1[3], box2[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    union = area1 + area2 - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def compare_backends(model_path, class_id, source, backends=("torch", "onnx", "openvino", "opencv"),
+                     int8=False, min_conf=0.25, num_frames=200):
+    """
+    Runs detect_best over recorded frames with each backend and compares latency and accuracy against
+    the first backend of the list (the reference).
+
+    :param source: Video file or directory of frames (see ReplayFrameSource).
+    """
+    from replay_camera import ReplayFrameSource
+    from yolo_object_detector import YoloObjectDetector
+
+    frame_source = ReplayFrameSource(source)
+    frames = []
+    for idx in range(min(num_frames, frame_source.num_frames)):
+        frame_source.seek(idx)
+        frames.append(frame_source.frame)
+    frame_source.release()
+
+    reference = None
+    for name in backends:
+        detector = YoloObjectDetector(class_id, model_path, backend=name, int8=int8 and name != "torch")
+        detector.detect_best(frames[0], min_conf)  # warm up
+
+        times = []
+        detections = []
+        for frame in frames:
+            start = time.perf_counter()
+            detections.append(detector.detect_best(frame, min_conf))
+            times.append(time.perf_counter() - start)
+        times = np.array(times) * 1000
+
+        line = f"{name:<10} mean: {times.mean():7.2f}ms  p95: {np.percentile(times, 95):7.2f}ms"
+        if reference is None:
+            reference = detections
+        else:
+            agree = [(box is None) == (ref_box is None) for (box, _), (ref_box, _) in zip(detections, reference)]
+            both = [(box, conf, ref_box, ref_conf) for (box, conf), (ref_box, ref_conf) in zip(detections, reference)
+                    if box is not None and ref_box is not None]
+            mean_iou = np.mean([box_iou(box, ref_box) for box, _, ref_box, _ in both]) if both else 0.0
+            conf_diff = np.mean([abs(conf - ref_conf) for _, conf, _, ref_conf in both]) if both else 0.0
+            line += f"  agreement: {np.mean(agree):.3f}  mean IoU: {mean_iou:.3f}  mean conf diff: {conf_diff:.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    import parameters as param
+
+    if len(sys.argv) < 2:
+        print("usage: python inference_backends.py <video_or_frames_dir> [int8]")
+        exit(1)
+
+    compare_backends(param.YOLO_MODEL_BALL, param.YOLO_MODEL_BALL_ID, sys.argv[1],
+                     int8=len(sys.argv) > 2 and sys.argv[2] == "int8")
@@ -10,9 +10,15 @@ from hexagons_board import HexagonsBoard
 from hex_board_model import HexBoardModel
 from yolo_object_detector import YoloObjectDetector
 from dual_camera import DualCamera
+from replay_camera import ReplayCamera
+from ball_locator import BallLocator, BallLocation
+from pipeline import GamePipeline
 import time
 from cv2_utils import stack_frames_vertically, stack_frames_horizontally, draw_cross, draw_yolo_box, put_text_centered
 from hex_graph import HexGraph
+from path_catalogue import PathCatalogue
+from led_animations import LedAnimator, pulse, blink, path_reveal
+import scoring
 from led_panel import LedPanel
 from game_status import GameStatus
 import logging
@@ -59,8 +65,9 @@ logger = logging.getLogger(__name__)
 
 class KingOfControl:
     class GameVariables:
-        def __init__(self, graph):
+        def __init__(self, graph, path_catalogue=None):
             self.graph = graph
+            self.path_catalogue = path_catalogue
             self.ball_detector = YoloObjectDetector(class_id=param.YOLO_MODEL_BALL_ID, model_path=param.YOLO_MODEL_BALL)
             self.paths = self.choose_new_paths()
             self.start_brightness = 128
@@ -76,6 +83,10 @@ class KingOfControl:
             self.draw_ball = True
 
         def choose_new_paths(self):
+            if self.path_catalogue is not None:
+                self.paths = self.path_catalogue.choose_paths(param.PATH_DIFFICULTY)
+                return self.paths
+
             self.paths = [self.graph.create_random_path_target_size(0, param.TARGET_PATH_SIZE),
                           self.graph.create_random_path_target_size(1, param.TARGET_PATH_SIZE)]
             return self.paths
@@ -98,10 +109,15 @@ class KingOfControl:
 
         logger.debug("Init Arduino")
         self.board = HexagonsBoard(port=param.ARDUINO_COM_PORT, baudrate=param.ARDUINO_BAUD_RATE)
+        self.led_animator = LedAnimator(self.board, param.LED_REFRESH_RATE) if param.LED_ANIMATIONS else None
 
         logger.debug("Init cameras")
-        self.cameras = DualCamera(cam1_id=param.CAMERA1_ID, cam2_id=param.CAMERA2_ID,
-                                  res1=param.CAMERA_RESOLUTION, res2=param.CAMERA_RESOLUTION)
+        if param.REPLAY_SOURCES:
+            self.cameras = ReplayCamera(*param.REPLAY_SOURCES, mode=param.REPLAY_MODE,
+                                        step=param.REPLAY_STEP, loop=param.REPLAY_LOOP)
+        else:
+            self.cameras = DualCamera(cam1_id=param.CAMERA1_ID, cam2_id=param.CAMERA2_ID,
+                                      res1=param.CAMERA_RESOLUTION, res2=param.CAMERA_RESOLUTION)
         logger.debug("Init Board Model")
         self.hex_model_cam1 = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(0, param.CAMERA_RESOLUTION[1]*2))
         self.hex_model_cam2 = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(param.CAMERA_RESOLUTION[0]*2, param.CAMERA_RESOLUTION[1]*2))
@@ -121,13 +137,30 @@ class KingOfControl:
             end_audio=param.END_AUDIO,
             off_image=param.OFF_IMAGE,
             offside_audio=param.OFFSIDE_AUDIO,
-            countdown_audio=param.COUNTDOWN_AUDIO
+            countdown_audio=param.COUNTDOWN_AUDIO,
+            preload_clips=param.LED_PANEL_PRELOAD_CLIPS,
+            clip_cache=param.LED_PANEL_CLIP_CACHE
         )
 
-        self.game_vars = self.GameVariables(self.graph)
+        self.path_catalogue = None
+        if param.PATH_CATALOGUE:
+            logger.debug("Init Path Catalogue")
+            self.path_catalogue = PathCatalogue(self.graph, param.TARGET_PATH_SIZE, pool_size=param.PATH_POOL_SIZE,
+                                                num_levels=param.PATH_DIFFICULTY_LEVELS,
+                                                recent_size=param.PATH_RECENT_SIZE,
+                                                file_path=param.PATH_CATALOGUE_FILE)
+            self.path_catalogue.fill(max_paths=param.PATH_CATALOGUE_FILL_LIMIT)
+            empty_pools = self.path_catalogue.get_empty_pools()
+            if empty_pools:
+                logger.warning(f"Path catalogue pools still empty (start column, level): {empty_pools}")
+            self.path_catalogue.start()
+        self.game_vars = self.GameVariables(self.graph, self.path_catalogue)
+        self.ball_locator = BallLocator(self.hex_model_cam1, self.hex_model_cam2)
         self.prev_camera1_exposure = 0
         self.prev_camera2_exposure = 0
         self.show_cameras_vertically = True
+        self.last_perf_stats_time = time.time()
+        self.pipeline = None
         if param.GAME_MODE == 0:
             self.game_mode = self.GameMode.NORMAL
         elif param.GAME_MODE == 1:
@@ -184,6 +217,12 @@ class KingOfControl:
         self.save_floor_quads(param.CALIBRATION_FILE, floor_quad1, floor_quad2)
 
     def shutdown(self):
+        self.stop_pipeline()
+        if self.led_animator is not None:
+            self.led_animator.stop()
+        if self.path_catalogue is not None:
+            self.path_catalogue.stop()
+            self.path_catalogue.save()
         self.led_panel.set_state(GameStatus.SHUTDOWN)
         self.led_panel.join()
         logger.debug("Led Panel Thread finished")
@@ -191,30 +230,77 @@ class KingOfControl:
         exit(0)
 
     def get_hex_under_ball_and_show_cameras(self):
-        hex, frame1, frame2 = self.get_hex_under_ball(self.game_vars.ball_detector)
-        composed_frame = \
-            stack_frames_vertically(frame1, frame2, 640, 720) if self.show_cameras_vertically else \
-            stack_frames_horizontally(frame1, frame2, 800, 225)
+        return self.get_ball_location_and_show_cameras().hex
+
+    def get_ball_location_and_show_cameras(self):
+        if self.pipeline is not None:
+            return self.get_pipeline_location_and_show_cameras()
+
+        location, frame1, frame2 = self.get_ball_location(self.game_vars.ball_detector)
+        composed_frame = self.compose_frames(frame1, frame2)
         cv2.imshow("game", composed_frame)
 
-        return hex
+        return location
+
+    def compose_frames(self, frame1, frame2):
+        return stack_frames_vertically(frame1, frame2, 640, 720) if self.show_cameras_vertically else \
+            stack_frames_horizontally(frame1, frame2, 800, 225)
+
+    def start_pipeline(self):
+        if not param.PIPELINED_EXECUTION or self.pipeline is not None:
+            return
+
+        def capture(_):
+            self.cameras.wait_new_frames()
+            return {"capture_time": time.monotonic(), "frames": self.cameras.get_frames()}
+
+        def inference(item):
+            frame1, frame2 = item["frames"]
+            item["location"] = self.ball_locator.locate(self.game_vars.ball_detector, frame1, frame2)
+            return item
+
+        def render(item):
+            frame1, frame2 = item["frames"]
+            self.draw_ball_location(item["location"], frame1, frame2)
+            item["composed_frame"] = self.compose_frames(frame1, frame2)
+            return item
+
+        self.pipeline = GamePipeline(capture, inference, render, param.PIPELINE_QUEUE_SIZE,
+                                     param.PIPELINE_MAX_CONSECUTIVE_ERRORS)
+        self.pipeline.start()
+
+    def stop_pipeline(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def get_pipeline_location_and_show_cameras(self):
+        # the state machine runs once per inference result
+        item = self.pipeline.get_result(timeout=1.0)
+
+        composed_frame = self.pipeline.get_composed_frame()
+        if composed_frame is not None:
+            cv2.imshow("game", composed_frame)
+
+        return item["location"] if item is not None else BallLocation()
 
     def run_cta(self):
         logger.debug("Running CTA")
         # waits for the player to put the ball on one of the first hexagons
 
-        # update LEDs of starting hexagons
-        self.game_vars.start_brightness += self.game_vars.brightness_direction
-        if self.game_vars.start_brightness >= 255:
-            self.game_vars.start_brightness = 255
-            self.game_vars.brightness_direction = -self.game_vars.brightness_direction
-        elif self.game_vars.start_brightness <= 0:
-            self.game_vars.start_brightness = 0
-            self.game_vars.brightness_direction = -self.game_vars.brightness_direction
+        # update LEDs of starting hexagons (pulsed by the LED animator when there is one)
+        if self.led_animator is None:
+            self.game_vars.start_brightness += self.game_vars.brightness_direction
+            if self.game_vars.start_brightness >= 255:
+                self.game_vars.start_brightness = 255
+                self.game_vars.brightness_direction = -self.game_vars.brightness_direction
+            elif self.game_vars.start_brightness <= 0:
+                self.game_vars.start_brightness = 0
+                self.game_vars.brightness_direction = -self.game_vars.brightness_direction
 
-        hex_color = (self.game_vars.start_brightness, self.game_vars.start_brightness, self.game_vars.start_brightness)
-        self.board.set_hexagon(0, 0, hex_color)
-        self.board.set_hexagon(1, 0, hex_color)
+            hex_color = (self.game_vars.start_brightness, self.game_vars.start_brightness, self.game_vars.start_brightness)
+            self.board.set_hexagon(0, 0, hex_color)
+            self.board.set_hexagon(1, 0, hex_color)
 
         hex = self.get_hex_under_ball_and_show_cameras()
 
@@ -265,18 +351,23 @@ class KingOfControl:
             self.game_vars.playing_time = param.MAX_TIME
             return GameStatus.END
 
-        hex = self.get_hex_under_ball_and_show_cameras()
+        location = self.get_ball_location_and_show_cameras()
+        hex = location.hex
 
         # if goal
         if hex and hex[1] == 8:
             return GameStatus.GOAL
 
         if hex in self.game_vars.chosen_path and hex not in self.game_vars.correct:
+            if self.led_animator is not None:
+                self.led_animator.release(hex)
             self.board.set_hexagon(*hex, self.GREEN)
             self.game_vars.correct.add(hex)
             logger.info(f"Score: {self.calculate_score(len(self.game_vars.correct), len(self.game_vars.wrong), 0, 0.0)}")
 
-        if hex and hex not in self.game_vars.chosen_path and hex not in self.game_vars.wrong:
+        # a position predicted by the ball tracker marks the path, but only a detection is wrong
+        if hex and not location.predicted and hex not in self.game_vars.chosen_path and \
+                hex not in self.game_vars.wrong:
             self.board.set_hexagon(*hex, self.RED)
             self.game_vars.wrong.add(hex)
             logger.info(f"Score: {self.calculate_score(len(self.game_vars.correct), len(self.game_vars.wrong), 0, 0.0)}")
@@ -291,6 +382,9 @@ class KingOfControl:
         self.game_vars.current_status = GameStatus.BLANK
         next_status = GameStatus.CTA
         while True:
+            # the LED changes of an iteration are sent together at its end
+            self.board.begin_frame()
+
             if self.game_vars.current_status == GameStatus.CTA:
                 next_status = self.run_cta()
             elif self.game_vars.current_status == GameStatus.COUNTDOWN:
@@ -312,6 +406,9 @@ class KingOfControl:
                 self.game_vars.current_status = next_status
                 self.game_vars.change_status_time = time.time()
                 self.led_panel.set_state(self.game_vars.current_status)
+                self.ball_locator.set_tracking(self.game_vars.current_status == GameStatus.GAME)
+                if self.led_animator is not None:
+                    self.led_animator.stop_all()
 
                 if self.game_vars.current_status == GameStatus.CTA:
                     self.game_vars.start_brightness = 0
@@ -319,6 +416,9 @@ class KingOfControl:
                     self.game_vars.choose_new_paths()
                     self.board.clear()
                     self.board.set_goal(self.WHITE)
+                    if self.led_animator is not None:
+                        self.led_animator.start_effect("start", pulse([(0, 0), (1, 0)], self.WHITE,
+                                                                      param.LED_PULSE_PERIOD))
 
                 elif self.game_vars.current_status == GameStatus.COUNTDOWN:
                     self.board.clear()
@@ -327,9 +427,13 @@ class KingOfControl:
                 elif self.game_vars.current_status == GameStatus.GAME:
                     # shows the path
                     self.board.clear()
-                    for i, node in enumerate(self.game_vars.chosen_path):
-                        if i > 0:
-                            self.board.set_hexagon(*node, self.WHITE)
+                    if self.led_animator is not None:
+                        self.led_animator.start_effect("path", path_reveal(self.game_vars.chosen_path[1:], self.WHITE,
+                                                                           param.LED_PATH_REVEAL_INTERVAL))
+                    else:
+                        for i, node in enumerate(self.game_vars.chosen_path):
+                            if i > 0:
+                                self.board.set_hexagon(*node, self.WHITE)
 
                     # game starts
                     self.game_vars.start_time = time.time()
@@ -341,14 +445,20 @@ class KingOfControl:
                     self.game_vars.playing_time = min(time.time() - self.game_vars.start_time, param.MAX_TIME)
                     self.game_vars.goal = 1
                     self.board.set_goal(self.GREEN)
+                    if self.led_animator is not None:
+                        self.led_animator.start_effect("goal", blink([self.board.GOAL], self.GREEN,
+                                                                     param.LED_GOAL_FLASH_PERIOD))
 
                 elif self.game_vars.current_status == GameStatus.OFFSIDE:
                     self.board.set_goal(self.RED)
+                    if self.led_animator is not None:
+                        self.led_animator.start_effect("offside", blink([self.board.GOAL], self.RED,
+                                                                        param.LED_OFFSIDE_BLINK_PERIOD))
 
                 elif self.game_vars.current_status == GameStatus.END:
                     self.board.set_goal(self.RED)
                     if self.game_mode == self.GameMode.NORMAL:
-                        self.led_panel.show_score = False
+                        self.led_panel.hide_score()
                     else:
                         if self.game_vars.goal == 0:
                             self.game_vars.playing_time = min(time.time() - self.game_vars.start_time, param.MAX_TIME)
@@ -365,62 +475,91 @@ class KingOfControl:
                 elif self.game_vars.current_status == GameStatus.OFF:
                     self.board.clear()
 
+            self.board.flush()
+            self.log_perf_stats()
+
             key = cv2.waitKey(1) & 0xFF
             self.process_key_press(key)
 
+    def log_perf_stats(self):
+        if param.PERF_STATS_INTERVAL <= 0 or time.time() - self.last_perf_stats_time < param.PERF_STATS_INTERVAL:
+            return
+        self.last_perf_stats_time = time.time()
+
+        for cam_id, stats in self.cameras.get_capture_stats().items():
+            logger.info(f"Perf camera {cam_id}: frame age: {stats['frame_age'] * 1000:.1f}ms, "
+                         f"dropped: {stats['dropped_frames']}, read failures: {stats['read_failures']}")
+
+        if self.pipeline is not None:
+            for name, stats in self.pipeline.get_stats().items():
+                logger.info(f"Perf pipeline {name}: " + ", ".join(
+                    f"{key}: {value * 1000:.1f}ms" if "latency" in key else f"{key}: {value:.1f}"
+                    for key, value in stats.items()))
+
+        if self.led_animator is not None:
+            animator_stats = self.led_animator.get_stats()
+            logger.info(f"Perf LED animations: ticks: {animator_stats['ticks']}, late: {animator_stats['late_ticks']}, "
+                        f"cells sent: {animator_stats['cells_sent']}")
+
+        panel_stats = self.led_panel.get_stats()
+        logger.info(f"Perf LED panel: frames: {panel_stats['frames_rendered']}, "
+                    f"dropped: {panel_stats['dropped_frames']}, repeated: {panel_stats['repeated_frames']}, "
+                    f"render: {panel_stats['avg_render_time'] * 1000:.2f}ms "
+                    f"(max {panel_stats['max_render_time'] * 1000:.2f}ms), "
+                    f"late: {panel_stats['avg_lateness'] * 1000:.2f}ms (max {panel_stats['max_lateness'] * 1000:.2f}ms)")
+        logger.info(f"Perf LED panel state: set_state: {panel_stats['avg_set_state_time'] * 1e6:.1f}us "
+                    f"(max {panel_stats['max_set_state_time'] * 1e6:.1f}us), "
+                    f"panel iteration: {panel_stats['avg_iteration_time'] * 1000:.2f}ms "
+                    f"(max {panel_stats['max_iteration_time'] * 1000:.2f}ms)")
+
+        board_stats = self.board.get_stats()
+        logger.info(f"Perf LEDs: packets sent: {board_stats['packets_sent']}, writes: {board_stats['writes']}, "
+                    f"unchanged: {board_stats['unchanged']}")
+        if "queue_depth" in board_stats:
+            logger.info(f"Perf serial: queue depth: {board_stats['queue_depth']} (max {board_stats['max_queue_depth']}), "
+                        f"coalesced: {board_stats['coalesced']}, "
+                        f"write: {board_stats['avg_write_time'] * 1000:.2f}ms (max {board_stats['max_write_time'] * 1000:.2f}ms), "
+                        f"queued: {board_stats['avg_queue_time'] * 1000:.2f}ms")
+
+        for cam_id, stats in self.game_vars.ball_detector.get_tracking_stats().items():
+            logger.info(f"Perf tracking camera {cam_id}: hit rate: {stats['hit_rate']:.2f}, hits: {stats['hits']}, "
+                        f"misses: {stats['misses']}, fallbacks: {stats['fallbacks']}, "
+                        f"full searches: {stats['full_searches']}")
+
     @staticmethod
     def calculate_score(num_correct, num_wrong, goal, time_left):
-        return time_left * param.TIME_SCORE + \
-            num_correct * param.HEX_CORRECT_SCORE + \
-            num_wrong * param.HEX_WRONG_SCORE + \
-            goal * param.GOAL_SCORE
+        return scoring.calculate_score(num_correct, num_wrong, goal, time_left)
 
     def get_hex_under_ball(self, ball_detector, update_frames=True):
-        frame1, frame2 = self.cameras.get_frames()
+        location, frame1, frame2 = self.get_ball_location(ball_detector, update_frames)
+        return location.hex, frame1, frame2
 
-        hex = None
-        cam_used = 0
-        hexagon = None
-        ball_pos = (0, 0)
-        bbox = None
-        conf = 0
-        for cam_id in param.CAMERA_PRIORITY:
-            frame = frame1 if cam_id == 1 else frame2
-            bbox, conf = ball_detector.detect_best(frame, param.MIN_CONFIDENCE_BALL)
-            if bbox is not None:
-                hex_model_cam = self.hex_model_cam1 if cam_id == 1 else self.hex_model_cam2
-                idx, enabled_polygon, ball_pos = hex_model_cam.get_polygon_under_ball(bbox)
-                cam_used = cam_id
-
-                if enabled_polygon:
-                    if cam_id == 1:
-                        hex = self.hex_model_cam1.hex_coordinates[idx]
-                        hexagon = self.hex_model_cam1.pers_polygons[idx]
-                    else:
-                        hex = self.hex_model_cam2.hex_coordinates[idx]
-                        hexagon = self.hex_model_cam2.pers_polygons[idx]
+    def get_ball_location(self, ball_detector, update_frames=True):
+        frame1, frame2 = self.cameras.get_frames()
 
-                break
+        location = self.ball_locator.locate(ball_detector, frame1, frame2)
 
         if update_frames:
-            self.hex_model_cam1.draw_hexagons(frame1, color=(200, 100, 100))
-            self.hex_model_cam2.draw_hexagons(frame2, color=(200, 100, 100))
+            self.draw_ball_location(location, frame1, frame2)
 
-            if cam_used == 1:
-                if hexagon is not None:
-                    self.hex_model_cam1.draw_polylines(frame1, hexagon, color=(0, 255, 255))
-                if self.game_vars.draw_ball:
-                    draw_yolo_box(frame1, box=bbox, label="Ball", conf=conf)
-                    draw_cross(frame1, ball_pos, color=(255, 255, 0))
+        return location, frame1, frame2
 
-            elif cam_used == 2:
-                if hexagon is not None:
-                    self.hex_model_cam2.draw_polylines(frame2, hexagon, color=(0, 255, 255))
-                if self.game_vars.draw_ball:
-                    draw_yolo_box(frame2, box=bbox, label="Ball", conf=conf)
-                    draw_cross(frame2, ball_pos, color=(255, 255, 0))
+    def draw_ball_location(self, location, frame1, frame2):
+        self.hex_model_cam1.draw_hexagons(frame1, color=(200, 100, 100))
+        self.hex_model_cam2.draw_hexagons(frame2, color=(200, 100, 100))
 
-        return hex, frame1, frame2
+        # a position predicted by the ball tracker is shown on the main camera
+        cam_id = location.cam_used or (param.CAMERA_PRIORITY[0] if location.hexagon is not None else 0)
+        if cam_id == 0:
+            return
+
+        frame = frame1 if cam_id == 1 else frame2
+        hex_model_cam = self.hex_model_cam1 if cam_id == 1 else self.hex_model_cam2
+        if location.hexagon is not None:
+            hex_model_cam.draw_hexagon(frame, location.idx, color=(0, 255, 255))
+        if self.game_vars.draw_ball and location.cam_used != 0:
+            draw_yolo_box(frame, box=location.bbox, label="Ball", conf=location.conf)
+            draw_cross(frame, location.ball_pos, color=(255, 255, 0))
 
     def process_key_press(self, key):
         if key == ord('q'):
@@ -449,7 +588,12 @@ class KingOfControl:
             self.game_vars.current_status = GameStatus.OFF
             self.led_panel.set_state(self.game_vars.current_status)
 
+            # the calibration reads the cameras and changes the board models
+            if self.led_animator is not None:
+                self.led_animator.stop_all()
+            self.stop_pipeline()
             self.calibrate_cameras()
+            self.start_pipeline()
 
             self.game_vars.current_status = GameStatus.END
 
@@ -466,6 +610,8 @@ class KingOfControl:
                     self.board.set_hexagon(*hex, (255, 255, 0))
                 last_hex = hex
 
+            self.log_perf_stats()
+
             key = cv2.waitKey(1) & 0xFF
             self.process_key_press(key)
 
@@ -549,10 +695,8 @@ class KingOfControl:
             # light up one hexagon
             self.board.clear()
             self.board.set_hexagon(*coord, self.RED)
-            time.sleep(0.2)
-            _, _ = self.cameras.get_frames()
-            time.sleep(0.2)
-            frame1, frame2 = self.cameras.get_frames()
+            time.sleep(0.2)  # lets the LED change
+            frame1, frame2 = self.cameras.get_frames_after(time.monotonic())
 
             frame = frame1 if camera_id == 1 else frame2
             results = None
@@ -598,10 +742,8 @@ class KingOfControl:
             # light up one hexagon
             self.board.clear()
             self.board.set_hexagon(*coord, self.RED)
-            time.sleep(0.2)
-            _, _ = self.cameras.get_frames()
-            time.sleep(0.2)
-            frame1, frame2 = self.cameras.get_frames()
+            time.sleep(0.2)  # lets the LED change
+            frame1, frame2 = self.cameras.get_frames_after(time.monotonic())
             results1 = None
 
             # find it in both cameras
@@ -688,7 +830,7 @@ class KingOfControl:
             hex_coord = self.hex_model_cam1.hex_coordinates[(hex_id + 1) % num_hexes]
 
             self.hex_model_cam1.draw_hexagons(frame1, color=(100, 100, 100))
-            self.hex_model_cam1.draw_polylines(frame1, pers_hex, color=(0, 255, 255))
+            self.hex_model_cam1.draw_hexagon(frame1, hex_id, color=(0, 255, 255))
 
             composed_frame = frame1  # stack_frames_vertically(frame1, frame2, 640, 720)
             winname = "Pressione espaco para continuar..."
@@ -749,8 +891,10 @@ class KingOfControl:
             self.cameras.set_exposure1(exposure, save=False)
         else:
             self.cameras.set_exposure2(exposure, save=False)
+        exposure_time = time.monotonic()
         while exposure <= max_exposure:
-            frame1, frame2 = self.cameras.get_frames()
+            # a frame taken with the exposure just set
+            frame1, frame2 = self.cameras.get_frames_after(exposure_time)
             frame = frame1 if camera_id == 1 else frame2
             boxes, avg_conf = hex_detector.detect_avg_confidence(frame, param.MIN_CONFIDENCE_HEXAGON)
             score = self.calculate_calibration_score(4, boxes, avg_conf)
@@ -761,15 +905,14 @@ class KingOfControl:
             else:
                 logger.debug(f"best_score: {best_score}, score: {score}, boxes: {len(boxes)}, avg_conf: {avg_conf}, best_exposure: {best_exposure}, exposure: {exposure}")
 
-            _, _ = self.cameras.get_frames()
             cv2.waitKey(60)
             exposure = exposure + 1
             if camera_id == 1:
                 self.cameras.set_exposure1(exposure, save=False)
             else:
                 self.cameras.set_exposure2(exposure, save=False)
+            exposure_time = time.monotonic()
 
-        _, _ = self.cameras.get_frames()
         cv2.waitKey(60)
         if camera_id == 1:
             self.cameras.set_exposure1(best_exposure, save=False)
@@ -800,6 +943,9 @@ class KingOfControl:
                 self.calibrate_cameras()
 
             self.led_panel.start()
+            if self.led_animator is not None:
+                self.led_animator.start()
+            self.start_pipeline()
 
             if self.game_mode == self.GameMode.NORMAL or self.game_mode == self.GameMode.POINTS:
                 self.game()
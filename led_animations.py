@@ -0,0 +1,199 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLACK = (0, 0, 0)
+
+
+class KeyframeEffect:
+    """
+    Time-based LED effect: the color of each cell follows a list of (time, color) keyframes, linearly
+    interpolated (or held until the next keyframe, for step effects).
+    """
+    def __init__(self, cells, keyframes, loop=False, step=False, delays=None):
+        """
+        :param cells: Cells of the board ((col, row) or HexagonsBoard.GOAL).
+        :param keyframes: [(time, color), ...] with increasing times in seconds, the first one at 0.
+        :param loop: Repeats the keyframes forever. Otherwise the effect ends after the last keyframe.
+        :param step: Holds the color of each keyframe instead of interpolating.
+        :param delays: Delay in seconds of the keyframes of each cell, to run the same effect in sequence.
+        """
+        self.cells = list(cells)
+        self.keyframes = keyframes
+        self.loop = loop
+        self.step = step
+        self.delays = delays or [0.0] * len(self.cells)
+        self.duration = keyframes[-1][0]
+
+    def is_finished(self, elapsed):
+        # every cell may have been released
+        return not self.loop and elapsed > self.duration + max(self.delays, default=0.0)
+
+    def color_at(self, t):
+        if t < 0:
+            return None  # not started yet, the cell is left as it is
+        if self.loop and self.duration > 0:
+            t = t % self.duration
+        elif t >= self.duration:
+            return self.keyframes[-1][1]
+
+        for (t1, color1), (t2, color2) in zip(self.keyframes, self.keyframes[1:]):
+            if t1 <= t < t2:
+                if self.step:
+                    return color1
+                f = (t - t1) / (t2 - t1)
+                return tuple(int(round(c1 + (c2 - c1) * f)) for c1, c2 in zip(color1, color2))
+        return self.keyframes[-1][1]
+
+    def colors_at(self, elapsed):
+        """
+        Returns {cell: color} of the cells that already started.
+        """
+        colors = {}
+        for cell, delay in zip(self.cells, self.delays):
+            color = self.color_at(elapsed - delay)
+            if color is not None:
+                colors[cell] = color
+        return colors
+
+
+def pulse(cells, color, period):
+    # from off to color and back
+    return KeyframeEffect(cells, [(0.0, BLACK), (period / 2, color), (period, BLACK)], loop=True)
+
+
+def blink(cells, color, period):
+    return KeyframeEffect(cells, [(0.0, color), (period / 2, BLACK), (period, BLACK)], loop=True, step=True)
+
+
+def path_reveal(cells, color, interval):
+    # each cell lights up interval seconds after the previous one
+    return KeyframeEffect(cells, [(0.0, color)], delays=[i * interval for i in range(len(cells))])
+
+
+class LedAnimator(threading.Thread):
+    """
+    Runs the LED effects on its own clock, at a fixed refresh rate, independently of the game loop.
+
+    Every tick the colors of the running effects are calculated (effects started later win on shared
+    cells) and only the cells whose color changed are sent to the board.
+    """
+    def __init__(self, board, refresh_rate=30.0):
+        super().__init__(name="led_animator", daemon=True)
+        self.board = board
+        self.period = 1.0 / refresh_rate
+        self.effects = {}  # name -> (effect, start time)
+        self.lock = threading.Lock()
+        self._running = True
+
+        self.ticks = 0
+        self.late_ticks = 0
+        self.cells_sent = 0
+
+    def start_effect(self, name, effect):
+        """
+        Starts an effect, replacing the running effect with the same name.
+        """
+        with self.lock:
+            self.effects[name] = (effect, time.monotonic())
+
+    def stop_effect(self, name):
+        """
+        Stops an effect. Its cells keep the color they have now.
+        """
+        with self.lock:
+            self.effects.pop(name, None)
+
+    def stop_all(self):
+        with self.lock:
+            self.effects.clear()
+
+    def is_running(self, name):
+        with self.lock:
+            return name in self.effects
+
+    def release(self, cell):
+        """
+        Removes a cell from the running effects, so the game can set it.
+        """
+        with self.lock:
+            for effect, _ in self.effects.values():
+                if cell in effect.cells:
+                    idx = effect.cells.index(cell)
+                    del effect.cells[idx]
+                    del effect.delays[idx]
+
+    def run(self):
+        next_tick = time.monotonic()
+        while self._running:
+            self.tick(time.monotonic())
+
+            next_tick += self.period
+            wait_time = next_tick - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            else:
+                # too late, skip the missed ticks instead of catching up
+                self.late_ticks += 1
+                next_tick = time.monotonic()
+
+    def tick(self, now):
+        with self.lock:
+            colors = {}
+            for name, (effect, start_time) in list(self.effects.items()):
+                elapsed = now - start_time
+                colors.update(effect.colors_at(elapsed))
+                if effect.is_finished(elapsed):
+                    del self.effects[name]
+
+            # compared and sent holding both locks: the game can't change a cell in between and a stopped
+            # effect never writes again
+            with self.board.lock:
+                changed = {cell: color for cell, color in colors.items() if self.board.colors[cell] != color}
+                if changed:
+                    try:
+                        self.board.set_cells(changed)
+                    except Exception as e:
+                        logger.error(f"LED animation: {e}")
+                    self.cells_sent += len(changed)
+            self.ticks += 1
+
+    def stop(self):
+        self._running = False
+        if self.is_alive():
+            self.join(timeout=1.0)
+
+    def get_stats(self):
+        return {"ticks": self.ticks, "late_ticks": self.late_ticks, "cells_sent": self.cells_sent}
+
+
+def test_release_all_cells():
+    """
+    Releases every cell of a running effect, like the player reaching the whole path before it is
+    revealed, and checks that the animator keeps running.
+    """
+    import parameters as param
+    from hexagons_board import HexagonsBoard
+
+    param.DUMMY_ARDUINO = 1
+    board = HexagonsBoard(None, None)
+    animator = LedAnimator(board)
+    cells = [(0, 0), (0, 1), (0, 2)]
+    animator.start_effect("path", path_reveal(cells, (255, 255, 255), 1.0))
+
+    now = time.monotonic()
+    animator.tick(now)
+    for cell in cells:
+        animator.release(cell)
+        board.set_hexagon(*cell, (0, 255, 0))
+    animator.tick(now + 10.0)
+
+    assert not animator.is_running("path"), "finished effect is still running"
+    assert all(board.colors[cell] == (0, 255, 0) for cell in cells), "released cell overwritten"
+    print("test_release_all_cells: ok")
+
+
+if __name__ == "__main__":
+    test_release_all_cells()
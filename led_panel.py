@@ -6,12 +6,19 @@ import random
 from PIL import ImageFont, ImageDraw, Image
 from audio_player import AudioPlayer
 import threading
+from collections import namedtuple
 from game_status import GameStatus
 import logging
 from cv2_utils import put_text_centered
+import math
+from video_clip import VideoClip, FramePacer
 
 logger = logging.getLogger(__name__)
 
+# what the panel shows, handed over from the game thread as a whole (see LedPanel.state)
+PanelState = namedtuple("PanelState", ["status", "show_score", "score_value", "playing_time", "num_correct",
+                                       "num_wrong", "num_goal"])
+
 
 class LedPanel(threading.Thread):
     def __init__(self,
@@ -34,11 +41,17 @@ class LedPanel(threading.Thread):
                  goal_audio=None,
                  offside_audio=None,
                  countdown_audio=None,
+                 preload_clips=True,
+                 clip_cache=True,
 
                  background_image_path='images/background.png'):
+        """
+        :param preload_clips: Decodes the videos once, resized to the window, instead of on every frame.
+        :param clip_cache: Memory-maps the preloaded frames from a .npy file next to each video instead of
+                           keeping them in RAM.
+        """
 
         super().__init__()
-        self.lock = threading.Lock()
 
         self.STATE_PLAY_DURATION = state_play_duration
         self.WINDOW_SIZE = window_size
@@ -46,10 +59,20 @@ class LedPanel(threading.Thread):
         self.FONT_SIZE = font_size
         self.TEXT_COLOR = text_color
 
-        self.current_state = GameStatus.BLANK
+        # Single slot mailbox: the game thread replaces the snapshot (an assignment is atomic), the panel
+        # thread reads it once per iteration. Nothing is shared while rendering, so set_state never waits.
+        # Only the game thread writes it.
+        self.state = PanelState(GameStatus.BLANK, False, 0, 0.0, 0, 0, 0)
         self.last_state = None
         self._running = True
 
+        self.set_state_calls = 0
+        self.total_set_state_time = 0.0
+        self.max_set_state_time = 0.0
+        self.iteration_count = 0
+        self.total_iteration_time = 0.0
+        self.max_iteration_time = 0.0  # the longest set_state had to wait when the panel held a lock
+
         # Recursos
         self.background_image = self.load_background_image(background_image_path)
         self.black_image = self.create_black_image()
@@ -63,21 +86,22 @@ class LedPanel(threading.Thread):
         self.score_endgame_image = self.load_background_image(score_endgame_image)
         self.off_image = self.load_background_image(off_image)
 
-        self.countdown_cap = cv2.VideoCapture(countdown_video_path)
-        self.game_cap = cv2.VideoCapture(game_video_path)
-        self.goal_cap = cv2.VideoCapture(goal_video_path)
-
-        self.game_cap_delay = 1.0 / self.game_cap.get(cv2.CAP_PROP_FPS)
+        video_paths = {
+            GameStatus.COUNTDOWN: countdown_video_path,
+            GameStatus.GAME: game_video_path,
+            GameStatus.GOAL: goal_video_path,
+        }
+        self.clips = {}
+        self.caps = {}
+        if preload_clips:
+            self.clips = self.load_clips(video_paths, clip_cache)
+        else:
+            self.caps = {state: cv2.VideoCapture(path) for state, path in video_paths.items()}
+        self.current_clip = None
+        self.frame_pacer = FramePacer()
 
         self.audio_player = AudioPlayer()
 
-        self.show_score = False
-        self.score_value = 0
-        self.playing_time = 0.0
-        self.num_correct = 0
-        self.num_wrong = 0
-        self.num_goal = 0
-
         self.game_audio = game_audio
         self.end_audio = end_audio
         self.cta_audio = cta_audio
@@ -102,12 +126,65 @@ class LedPanel(threading.Thread):
             logger.error(f"Erro ao carregar imagem de fundo: {e}")
             return self.black_image
 
-    def play_video(self, cap):
+    def load_clips(self, video_paths, use_cache):
+        clips = {}
+        total_size = 0
+        for state, path in video_paths.items():
+            start = time.perf_counter()
+            clip = VideoClip.load(path, self.WINDOW_SIZE, use_cache)
+            clips[state] = clip
+            if clip is None:
+                logger.error(f"Erro ao carregar o vídeo {path}")
+                continue
+            total_size += clip.memory_size()
+            logger.info(f"Clip {clip.name}: {len(clip)} frames at {clip.fps:.1f}fps, "
+                        f"{clip.memory_size() / 2 ** 20:.1f}MB "
+                        f"{'memory-mapped' if clip.is_memory_mapped() else 'in RAM'}, "
+                        f"loaded in {time.perf_counter() - start:.2f}s")
+        logger.info(f"Clips: {total_size / 2 ** 20:.1f}MB")
+        return clips
+
+    def get_video_fps(self, state):
+        if self.clips:
+            clip = self.clips[state]
+            return clip.fps if clip is not None else 30.0
+        return self.caps[state].get(cv2.CAP_PROP_FPS) or 30.0
+
+    def render_video_frame(self, status):
+        """
+        Shows the frame of the current video that is due now, if it isn't on screen already.
+        """
+        due = self.frame_pacer.begin_frame(time.monotonic())
+        if due is None:
+            return
+        index, skipped = due
+
+        start = time.perf_counter()
+        if self.clips:
+            self.play_clip(self.current_clip, index)
+        else:
+            self.play_video(self.caps[status], skipped)
+        self.frame_pacer.end_frame(time.perf_counter() - start, time.monotonic())
+
+    def play_clip(self, clip, index):
+        if clip is None:
+            logger.error("Erro ao abrir o vídeo")
+            self._running = False
+            return
+
+        cv2.imshow("App", clip.get_frame(index))
+
+    def play_video(self, cap, skipped=0):
         if not cap.isOpened():
             logger.error("Erro ao abrir o vídeo")
             self._running = False
             return
 
+        # the dropped frames are only grabbed, not decoded
+        for _ in range(skipped):
+            if not cap.grab():
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
         ret, frame = cap.read()
         if not ret:
             cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
@@ -147,25 +224,23 @@ class LedPanel(threading.Thread):
     def show_screen(self, image, title="App"):
         cv2.imshow(title, image)
 
-    def set_score_values(self, score, playing_time, correct, wrong, goal):
-        self.show_score = True
-        self.score_value = score
-        self.playing_time = playing_time
-        self.num_correct = correct
-        self.num_wrong = wrong
-        self.num_goal = goal
-
-    def show_score_screen(self):
+    def show_score_screen(self, state):
         img = copy.deepcopy(self.score_endgame_image)
         font = cv2.FONT_HERSHEY_TRIPLEX
 
-        put_text_centered(img, f"{self.score_value}", (973, 58), font, 2.2, (255, 255, 255), 2)
-        cv2.putText(img, f"{self.playing_time:.2f}s", (1418, 59), font, 1.2, (255, 255, 255), 2)
-        cv2.putText(img, f"{self.num_correct}", (1418, 114), font, 1.2, (255, 255, 255), 2)
-        cv2.putText(img, f"{self.num_wrong}", (1418, 171), font, 1.2, (255, 255, 255), 2)
-        cv2.putText(img, f"{self.num_goal}", (1418, 229), font, 1.2, (255, 255, 255), 2)
+        put_text_centered(img, f"{state.score_value}", (973, 58), font, 2.2, (255, 255, 255), 2)
+        cv2.putText(img, f"{state.playing_time:.2f}s", (1418, 59), font, 1.2, (255, 255, 255), 2)
+        cv2.putText(img, f"{state.num_correct}", (1418, 114), font, 1.2, (255, 255, 255), 2)
+        cv2.putText(img, f"{state.num_wrong}", (1418, 171), font, 1.2, (255, 255, 255), 2)
+        cv2.putText(img, f"{state.num_goal}", (1418, 229), font, 1.2, (255, 255, 255), 2)
         self.show_screen(img)
 
+    def show_end_screen(self, state):
+        if state.show_score:
+            self.show_score_screen(state)
+        else:
+            self.show_screen(self.endgame_image)
+
     def display_text_centered(self, img, text, font_size, offset=(0, 0)):
         try:
             font = ImageFont.truetype(self.FONT_PATH, font_size)
@@ -211,73 +286,119 @@ class LedPanel(threading.Thread):
         self.create_left_top_window("App", 1536, 256)
 
         while self._running:
-            with self.lock:
-                if self.current_state != self.last_state:
-                    logger.debug(f"run: {self.current_state}")
-                    self.audio_player.stop_all()
+            # one read of the mailbox, the whole iteration renders this snapshot
+            state = self.state
+            last_state = self.last_state
+            start = time.perf_counter()
+
+            if last_state is None or state.status != last_state.status:
+                logger.debug(f"run: {state.status}")
+                self.audio_player.stop_all()
 
-                    current_cap = None
-                    if self.current_state == GameStatus.CTA:
-                        #self.audio_player.play_loop(self.cta_audio)
-                        self.show_screen(self.cta_image)
+                if state.status == GameStatus.CTA:
+                    #self.audio_player.play_loop(self.cta_audio)
+                    self.show_screen(self.cta_image)
 
-                    elif self.current_state == GameStatus.COUNTDOWN:
-                        self.audio_player.play_once(self.countdown_audio)
-                        current_cap = self.countdown_cap
-                        current_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                elif state.status == GameStatus.COUNTDOWN:
+                    self.audio_player.play_once(self.countdown_audio)
+                    self.start_video(GameStatus.COUNTDOWN)
 
-                    elif self.current_state == GameStatus.GAME:
-                        self.audio_player.play_once(self.game_audio)
-                        current_cap = self.game_cap
-                        current_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        #self.show_screen(self.cta_image)
+                elif state.status == GameStatus.GAME:
+                    self.audio_player.play_once(self.game_audio)
+                    self.start_video(GameStatus.GAME)
+                    #self.show_screen(self.cta_image)
 
-                    elif self.current_state == GameStatus.GOAL:
-                        self.audio_player.play_once(self.goal_audio)
-                        current_cap = self.goal_cap
-                        current_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                elif state.status == GameStatus.GOAL:
+                    self.audio_player.play_once(self.goal_audio)
+                    self.start_video(GameStatus.GOAL)
 
-                    elif self.current_state == GameStatus.OFFSIDE:
-                        self.audio_player.play_once(self.offside_audio)
-                        self.show_screen(self.offside_image)
+                elif state.status == GameStatus.OFFSIDE:
+                    self.audio_player.play_once(self.offside_audio)
+                    self.show_screen(self.offside_image)
 
-                    elif self.current_state == GameStatus.END:
-                        self.audio_player.play_once(self.end_audio)
-                        if self.show_score:
-                            self.show_score_screen()
-                        else:
-                            self.show_screen(self.endgame_image)
+                elif state.status == GameStatus.END:
+                    self.audio_player.play_once(self.end_audio)
+                    self.show_end_screen(state)
 
-                    elif self.current_state == GameStatus.OFF:
-                        self.audio_player.stop_all()
-                        self.show_screen(self.off_image)
+                elif state.status == GameStatus.OFF:
+                    self.audio_player.stop_all()
+                    self.show_screen(self.off_image)
 
-                    elif self.current_state == GameStatus.BLANK:
-                        #self.show_blank_screen()
-                        self.show_red_screen()
+                elif state.status == GameStatus.BLANK:
+                    #self.show_blank_screen()
+                    self.show_red_screen()
 
-                    elif self.current_state == GameStatus.SHUTDOWN:
-                        logger.debug("Led Panel shutdown")
-                        break
+                elif state.status == GameStatus.SHUTDOWN:
+                    logger.debug("Led Panel shutdown")
+                    break
 
-                    self.last_state = self.current_state
+            elif state != last_state and state.status == GameStatus.END:
+                # the score arrived after the end screen was shown
+                self.show_end_screen(state)
 
-                if self.current_state in [GameStatus.COUNTDOWN, GameStatus.GOAL, GameStatus.GAME]: #
-                    self.play_video(current_cap)
+            self.last_state = state
 
-            cv2.waitKey(30)
+            playing_video = state.status in [GameStatus.COUNTDOWN, GameStatus.GOAL, GameStatus.GAME]
+            if playing_video:
+                self.render_video_frame(state.status)
+            self.update_iteration_stats(time.perf_counter() - start)
+
+            # waits until the next frame of the video is due, rounded up so it doesn't wake up early
+            wait_time = self.frame_pacer.get_wait_time(time.monotonic()) if playing_video else 0.03
+            cv2.waitKey(max(1, math.ceil(wait_time * 1000)))
 
         logger.debug("Destroying all windows!")
         cv2.destroyWindow("App")
         logger.debug("led panel exit!")
 
+    def start_video(self, state):
+        if self.clips:
+            self.current_clip = self.clips[state]
+        else:
+            self.caps[state].set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.frame_pacer.start(self.get_video_fps(state), time.monotonic())
+
+    def update_iteration_stats(self, iteration_time):
+        self.iteration_count += 1
+        self.total_iteration_time += iteration_time
+        self.max_iteration_time = max(self.max_iteration_time, iteration_time)
+
+    def get_stats(self):
+        """
+        Stats of the video frames (see FramePacer), of the set_state calls and of the panel iterations.
+        The iteration time is what set_state used to wait for when the panel rendered holding a lock.
+        """
+        stats = self.frame_pacer.get_stats()
+        stats["avg_iteration_time"] = self.total_iteration_time / max(self.iteration_count, 1)
+        stats["max_iteration_time"] = self.max_iteration_time
+        stats["set_state_calls"] = self.set_state_calls
+        stats["avg_set_state_time"] = self.total_set_state_time / max(self.set_state_calls, 1)
+        stats["max_set_state_time"] = self.max_set_state_time
+        return stats
+
+    def update_state(self, **values):
+        """
+        Replaces the state snapshot with a copy that has the given values.
+        """
+        start = time.perf_counter()
+        self.state = self.state._replace(**values)
+        elapsed = time.perf_counter() - start
+        self.set_state_calls += 1
+        self.total_set_state_time += elapsed
+        self.max_set_state_time = max(self.max_set_state_time, elapsed)
+
     def set_state(self, state):
-        with self.lock:
-            self.current_state = state
+        self.update_state(status=state)
 
     def set_score_value(self, score):
-        with self.lock:
-            self.score_value = score
+        self.update_state(score_value=score)
+
+    def set_score_values(self, score, playing_time, correct, wrong, goal):
+        self.update_state(show_score=True, score_value=score, playing_time=playing_time, num_correct=correct,
+                          num_wrong=wrong, num_goal=goal)
+
+    def hide_score(self):
+        self.update_state(show_score=False)
 
 
 if __name__ == "__main__":
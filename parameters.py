@@ -3,9 +3,28 @@ from local_parameters import *
 CAMERA1_ID = 0
 CAMERA2_ID = 1
 CAMERA_RESOLUTION = (640, 360)
+CAMERA_THREADED_CAPTURE = 1  # set to 0 to read the cameras on the game thread
+PIPELINED_EXECUTION = 0      # set to 1 to run capture, ball detection and debug rendering as separate threads
+PIPELINE_QUEUE_SIZE = 1      # frames waiting between stages, the oldest is dropped when full
+PIPELINE_MAX_CONSECUTIVE_ERRORS = 30  # errors in a row that stop the pipeline (and the game)
+
+# play recordings instead of the cameras, e.g. ("replay_cam1.mp4", "replay_cam2.mp4") or two frame directories
+REPLAY_SOURCES = None
+REPLAY_MODE = "realtime"  # realtime, fast or step
+REPLAY_STEP = 1 / 30      # in seconds, used by the step mode
+REPLAY_LOOP = 1
 
 ARDUINO_BAUD_RATE = 115200
 DUMMY_ARDUINO = 0  # set to 1 to run without an Arduino
+ARDUINO_ASYNC_SENDER = 1  # write to the serial from a background thread, only the latest color of each hexagon
+ARDUINO_BULK_PROTOCOL = 0  # bulk commands (many hexagons / full frame in one packet), needs a firmware that knows them
+LED_ANIMATIONS = 1  # time-based LED effects on their own thread instead of stepping them in the game loop
+LED_REFRESH_RATE = 30  # LED animation updates per second
+LED_PULSE_PERIOD = 1.7  # in seconds, pulse of the start hexagons
+LED_PATH_REVEAL_INTERVAL = 0.06  # in seconds, between the hexagons of the path
+LED_GOAL_FLASH_PERIOD = 0.4  # in seconds
+LED_OFFSIDE_BLINK_PERIOD = 0.6  # in seconds
+LED_FRAME_BUFFER = 1  # keep the LED changes of a game loop iteration and send only the changed cells at once
 
 GAME_MODE = 0  # 0-NORMAL, 1-TRACK, 2-POINTS
 
@@ -13,13 +32,36 @@ LOG_API = "https://dbutils.ddns.net"
 
 HEXAGONS_SVG_FILE = r"static\assets\hexagons2.svg"
 HEXAGONS_SVG_OFFSET = (-75.0, 150.0)
+HEXAGONS_SVG_SAMPLE_INTERVAL = 100000.0  # length of the segments used to sample the curves of the SVG
+HEXAGONS_GEOMETRY_CACHE = 1  # keep the parsed SVG in a .npz file next to it, rebuilt when the SVG changes
+HEX_LOOKUP_BOARD_PLANE = 1  # find the hexagon under the ball on the board plane instead of the camera frame
+BALL_RADIUS_SCALE_MAP = 0  # precompute the radius scale of the ball contact point for every pixel
 
 YOLO_MODEL_HEXAGON = r"static\models\yolo11m_hexagon.pt"
 xYOLO_MODEL_BALL = r"static\models\custom_ball.pt"
 YOLO_MODEL_BALL = r"static\models\ucl_custom_ball_v3.pt"
 YOLO_MODEL_BALL_ID = 0
+YOLO_BACKEND = "torch"  # torch, onnx (ONNX Runtime), openvino or opencv (OpenCV DNN), exported on first use
+YOLO_INT8 = 0           # set to 1 to use INT8 quantized weights (onnx and openvino only)
+INFERENCE_INT8_DATA = r"static\datasets\board_ball.yaml"  # dataset yaml of board captures calibrating the openvino INT8 export
 MIN_CONFIDENCE_BALL = 0.65
 MIN_CONFIDENCE_HEXAGON = 0.70
+BATCHED_INFERENCE = 1  # run both cameras through the ball model in a single call
+ROI_INFERENCE = 1      # only search the ball in the region of the frame covered by the board
+ROI_MARGIN = (40, 120, 40)  # in pixels: horizontal, top (room for the ball above the far edge), bottom
+ROI_INFERENCE_IMGSZ = 480   # model input size for the board region
+TRACKING_INFERENCE = 1      # during the game, only search the ball around its last position
+TRACKING_WINDOW_SIZE = (320, 320)  # in pixels
+TRACKING_WINDOW_GROWTH = 1.5       # window scale factor after each miss
+TRACKING_MAX_MISSES = 3            # misses before going back to searching the whole board
+TRACKING_WINDOW_IMGSZ = 320        # model input size for the tracking window
+BALL_TRACKER = 1                   # during the game, fuse both cameras in a Kalman filter on the board plane
+BALL_TRACKER_MODEL = "velocity"    # velocity or acceleration
+BALL_TRACKER_PROCESS_NOISE = 500.0
+BALL_TRACKER_MEASUREMENT_NOISE = 2.0     # in board units
+BALL_TRACKER_MAX_PREDICTION_TIME = 0.5   # in seconds without detections before the ball is lost
+BALL_TRACKER_MIN_CONFIDENCE = 0.3        # below it the model runs on every frame and no hexagon is reported
+BALL_TRACKER_INFERENCE_INTERVAL = 2      # run the model every N frames while the tracker is confident
 
 # game parameters
 MAX_TIME = 10    # in seconds
@@ -29,6 +71,13 @@ GOAL_TIME = 8
 OFFSIDE_TIME = 3
 
 TARGET_PATH_SIZE = 9
+PATH_CATALOGUE = 1  # draw the paths from a pool generated in the background
+PATH_CATALOGUE_FILE = "path_catalogue.json"
+PATH_POOL_SIZE = 20  # paths per start column and difficulty level
+PATH_CATALOGUE_FILL_LIMIT = 5000  # paths generated at most at startup, the refill thread generates the rest
+PATH_DIFFICULTY_LEVELS = 3
+PATH_DIFFICULTY = None  # difficulty level of the paths of a game, None for any level
+PATH_RECENT_SIZE = 10  # number of recent paths that are not repeated
 TIME_SCORE = 500   # points per second
 HEX_CORRECT_SCORE = 300
 HEX_WRONG_SCORE = -700
@@ -50,6 +99,10 @@ OFF_IMAGE = r"images\off.png"
 COUNTDOWN_VIDEO = r"images\countdown_30fps.mp4"
 GAME_VIDEO = r"images\game_30fps.mp4"
 GOAL_VIDEO = r"images\goal_30fps.mp4"
+LED_PANEL_PRELOAD_CLIPS = 1  # decode the videos once at startup, resized to the panel, instead of on every frame
+LED_PANEL_CLIP_CACHE = 1     # memory-map the decoded frames from a .npy file next to each video instead of keeping them in RAM
+
+PERF_STATS_INTERVAL = 10  # in seconds, 0 disables the periodic performance stats log
 
 LOGS_PATH = "logs"
 STATS_LOG_FILENAME = f"{LOGS_PATH}\\hnk_reictrl_{LOCATION}.log"
@@ -0,0 +1,262 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PathInfo:
+    def __init__(self, path, lateral_moves, difficulty, level=0):
+        self.path = path                    # list of (col, row)
+        self.lateral_moves = lateral_moves  # moves inside the same row
+        self.difficulty = difficulty        # -log of the probability of the path, rarer paths are harder
+        self.level = level                  # difficulty level, from 0 (easiest) to num_levels - 1
+
+    def __len__(self):
+        return len(self.path)
+
+    def to_dict(self):
+        return {"path": self.path, "lateral_moves": self.lateral_moves, "difficulty": self.difficulty}
+
+    @staticmethod
+    def from_dict(data):
+        return PathInfo([tuple(node) for node in data["path"]], data["lateral_moves"], data["difficulty"])
+
+
+class PathCatalogue:
+    """
+    Pool of paths of the target size, generated ahead of time so that choosing the paths of a new game
+    doesn't create them on the game thread.
+
+    The paths are kept per start column and difficulty level, so drawing one is a pop from a deque. A
+    background thread refills the pool as paths are drawn, and paths drawn recently are not repeated.
+    """
+    def __init__(self, graph, target_size, pool_size=20, num_levels=3, recent_size=10, file_path=None):
+        """
+        :param graph: HexGraph that creates the paths.
+        :param target_size: Number of nodes of the paths.
+        :param pool_size: Paths kept for each start column and difficulty level.
+        :param num_levels: Number of difficulty levels, the paths are split in levels of equal probability.
+        :param recent_size: Number of drawn paths that are not repeated.
+        :param file_path: JSON file the pool is loaded from and saved to (see load and save).
+        """
+        self.graph = graph
+        self.target_size = target_size
+        self.pool_size = pool_size
+        self.num_levels = num_levels
+        self.file_path = file_path
+        self.start_cols = sorted(col for col, row in graph.nodes if row == 0)
+
+        # builds every length distribution now, the refill thread then only reads them
+        for start_col in self.start_cols:
+            graph.get_path_size_distribution(start_col)
+        self.thresholds = {start_col: self.calculate_thresholds(start_col) for start_col in self.start_cols}
+
+        # a column has fewer levels when its paths don't have enough different difficulties
+        self.pools = {(start_col, level): deque() for start_col in self.start_cols
+                      for level in range(len(self.thresholds[start_col]) + 1)}
+        self.recent = deque(maxlen=recent_size)
+        self.condition = threading.Condition()
+        self.generated = 0
+        self.drawn = 0
+        self.misses = 0  # draws that had to create the path on the calling thread
+
+        self._running = False
+        self.thread = None
+
+        if file_path and os.path.exists(file_path):
+            self.load(file_path)
+
+    def calculate_thresholds(self, start_col, num_samples=2000):
+        """
+        Difficulty values that split the paths of a start column in levels of equal probability.
+
+        The difficulties are discrete, so quantiles can be equal: the repeated ones (and one equal to the
+        easiest path, which would leave level 0 empty) are dropped, so every level has paths.
+        """
+        difficulties = sorted(self.create_path_info(start_col).difficulty for _ in range(num_samples))
+        quantiles = [difficulties[len(difficulties) * level // self.num_levels] for level in range(1, self.num_levels)]
+        return sorted(set(q for q in quantiles if q > difficulties[0]))
+
+    def get_column_level(self, start_col, level):
+        """
+        Level of the start column for a level from 0 to num_levels - 1.
+        """
+        return level * (len(self.thresholds[start_col]) + 1) // self.num_levels
+
+    def create_path_info(self, start_col):
+        path = self.graph.create_random_path_target_size(start_col, self.target_size)
+        lateral_moves = sum(1 for (_, row1), (_, row2) in zip(path, path[1:]) if row1 == row2)
+        probability = self.graph.get_path_probability(path)
+        return PathInfo(path, lateral_moves, -math.log(probability))
+
+    def get_level(self, start_col, difficulty):
+        level = 0
+        for threshold in self.thresholds[start_col]:
+            if difficulty >= threshold:
+                level += 1
+        return level
+
+    def add(self, path_info, start_col):
+        """
+        Adds a path to the pool of its level. Returns False if that pool is full.
+        """
+        path_info.level = self.get_level(start_col, path_info.difficulty)
+        with self.condition:
+            pool = self.pools[(start_col, path_info.level)]
+            if len(pool) >= self.pool_size:
+                return False
+            pool.append(path_info)
+            return True
+
+    def is_full(self):
+        return all(len(pool) >= self.pool_size for pool in self.pools.values())
+
+    def fill(self, max_paths=None):
+        """
+        Generates paths until every pool is full (or max_paths were generated).
+        """
+        count = 0
+        while not self.is_full() and (max_paths is None or count < max_paths):
+            for start_col in self.start_cols:
+                self.add(self.create_path_info(start_col), start_col)
+                count += 1
+        self.generated += count
+        return count
+
+    def get_empty_pools(self):
+        with self.condition:
+            return [key for key, pool in self.pools.items() if not pool]
+
+    def start(self):
+        self._running = True
+        self.thread = threading.Thread(target=self.refill, name="path_catalogue", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=2.0)
+
+    def refill(self):
+        while self._running:
+            with self.condition:
+                self.condition.wait_for(lambda: not self._running or not self.is_full())
+            if not self._running:
+                break
+
+            try:
+                self.fill(max_paths=50)
+            except Exception as e:
+                logger.error(f"Path catalogue refill: {e}")
+                time.sleep(1.0)
+
+            # the paths of one level can be rare, don't hog the CPU looking for them
+            time.sleep(0.01)
+
+    def draw(self, start_col, level=None):
+        """
+        Returns a path (list of (col, row)) starting at the column, with the difficulty level or any
+        level (None), that isn't one of the recently drawn paths when the pool has another one.
+        """
+        num_levels = len(self.thresholds[start_col]) + 1
+        levels = [self.get_column_level(start_col, level)] if level is not None else \
+            sorted(range(num_levels), key=lambda l: -len(self.pools[(start_col, l)]))
+        with self.condition:
+            for l in levels:
+                pool = self.pools[(start_col, l)]
+                # looks at each path at most once, the recent ones go back to the end of the pool
+                for _ in range(len(pool)):
+                    path_info = pool.popleft()
+                    if tuple(path_info.path) not in self.recent:
+                        self.use(path_info)
+                        return path_info.path
+                    pool.append(path_info)
+
+        # pool empty or only recent paths
+        self.misses += 1
+        path_info = self.create_path_info(start_col)
+        with self.condition:
+            self.use(path_info)
+        return path_info.path
+
+    def use(self, path_info):
+        self.recent.append(tuple(path_info.path))
+        self.drawn += 1
+        self.condition.notify()
+
+    def choose_paths(self, level=None):
+        """
+        Returns one path for each start column.
+        """
+        return [self.draw(start_col, level) for start_col in self.start_cols]
+
+    def save(self, file_path=None):
+        file_path = file_path or self.file_path
+        with self.condition:
+            data = {
+                "target_size": self.target_size,
+                "pools": {f"{start_col},{level}": [path_info.to_dict() for path_info in pool]
+                          for (start_col, level), pool in self.pools.items()},
+            }
+        try:
+            with open(file_path, 'w') as f:
+                json.dump(data, f)
+        except OSError as e:
+            logger.warning(f"Failed to save the path catalogue {file_path}: {e}")
+
+    def load(self, file_path=None):
+        """
+        Adds the paths of a file written by save. Files with another target size are ignored.
+        """
+        file_path = file_path or self.file_path
+        try:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load the path catalogue {file_path}: {e}")
+            return 0
+
+        if data.get("target_size") != self.target_size:
+            logger.info(f"Path catalogue {file_path} has paths of another size, ignored")
+            return 0
+
+        count = 0
+        for key, paths in data["pools"].items():
+            start_col = int(key.split(',')[0])
+            if start_col not in self.thresholds:
+                continue
+            for path_data in paths:
+                count += self.add(PathInfo.from_dict(path_data), start_col)
+        logger.debug(f"Loaded {count} paths from {file_path}")
+        return count
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                "pool_sizes": {key: len(pool) for key, pool in self.pools.items()},
+                "generated": self.generated,
+                "drawn": self.drawn,
+                "misses": self.misses,
+            }
+
+
+if __name__ == "__main__":
+    from hex_graph import HexGraph
+
+    catalogue = PathCatalogue(HexGraph(), 9)
+    start = time.perf_counter()
+    catalogue.fill()
+    print(f"fill: {time.perf_counter() - start:.3f}s, thresholds: {catalogue.thresholds}")
+
+    for level in range(catalogue.num_levels):
+        start = time.perf_counter()
+        paths = catalogue.choose_paths(level)
+        print(f"level {level}: {(time.perf_counter() - start) * 1e6:.1f}us {paths}")
+    print(catalogue.get_stats())
@@ -0,0 +1,185 @@
+import time
+import threading
+from collections import deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LatestQueue:
+    """
+    Bounded queue between pipeline stages. Putting never blocks: when the queue is full the oldest
+    item is dropped, so a slow consumer always gets the most recent items.
+    """
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Returns the oldest item, waiting up to timeout seconds for one (None waits forever, 0 doesn't wait).
+
+        :return: The item or None if the queue is still empty.
+        """
+        with self.condition:
+            if not self.items and timeout != 0:
+                self.condition.wait_for(lambda: len(self.items) > 0, timeout)
+            return self.items.popleft() if self.items else None
+
+    def clear(self):
+        with self.condition:
+            self.items.clear()
+
+    def depth(self):
+        return len(self.items)
+
+
+class PipelineStage(threading.Thread):
+    """
+    Runs func on every item of the input queue (or continuously, for a source stage without input)
+    and puts the result on each output queue. Results that are None are not forwarded.
+
+    An exception is logged and the item skipped, but after max_consecutive_errors in a row (e.g. a camera
+    that failed or a replay that ended) the stage stops and keeps the exception in self.error.
+    """
+    def __init__(self, name, func, input_queue=None, output_queues=(), max_consecutive_errors=30):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queues = output_queues
+        self.max_consecutive_errors = max_consecutive_errors
+        self._running = True
+        self.error = None
+        self.consecutive_errors = 0
+
+        self.processed = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.start_time = time.monotonic()
+
+    def run(self):
+        while self._running:
+            item = None
+            if self.input_queue is not None:
+                item = self.input_queue.get(timeout=0.1)
+                if item is None:
+                    continue
+
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                self.errors += 1
+                self.consecutive_errors += 1
+                if self.consecutive_errors >= self.max_consecutive_errors:
+                    logger.critical(f"Pipeline stage {self.name} stopped after {self.consecutive_errors} errors: {e}")
+                    self.error = e
+                    self._running = False
+                    break
+                logger.error(f"Pipeline stage {self.name}: {e}")
+                time.sleep(0.01)
+                continue
+            latency = time.perf_counter() - start
+            self.consecutive_errors = 0
+
+            self.processed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+            if result is not None:
+                for queue in self.output_queues:
+                    queue.put(result)
+
+    def stop(self):
+        self._running = False
+        if self.is_alive():
+            self.join(timeout=2.0)
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self.start_time
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "fps": self.processed / elapsed if elapsed > 0 else 0.0,
+            "avg_latency": self.total_latency / self.processed if self.processed > 0 else 0.0,
+            "max_latency": self.max_latency,
+            "queue_depth": self.input_queue.depth() if self.input_queue is not None else 0,
+            "queue_dropped": self.input_queue.dropped if self.input_queue is not None else 0,
+        }
+
+
+class GamePipeline:
+    """
+    Capture, inference and debug rendering of the game as separate stages connected by latest-wins queues,
+    so the loop runs at the speed of the slowest stage instead of the sum of all of them.
+
+    Every item is a dict created by the capture stage ("capture_time", "frames") and filled by the next
+    stages ("location" by the inference, "composed_frame" by the rendering). The game thread consumes
+    the inference results with get_result and shows the rendered frames with get_composed_frame.
+    """
+    def __init__(self, capture_func, inference_func, render_func, queue_size=1, max_consecutive_errors=30):
+        self.capture_queue = LatestQueue(queue_size)
+        self.results_queue = LatestQueue(queue_size)
+        self.render_queue = LatestQueue(queue_size)
+        self.display_queue = LatestQueue(1)
+
+        self.stages = [
+            PipelineStage("capture", capture_func, None, [self.capture_queue], max_consecutive_errors),
+            PipelineStage("inference", inference_func, self.capture_queue, [self.results_queue, self.render_queue],
+                          max_consecutive_errors),
+            PipelineStage("render", render_func, self.render_queue, [self.display_queue], max_consecutive_errors),
+        ]
+        self.latency_count = 0
+        self.total_latency = 0.0
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def check_stages(self):
+        """
+        Raises RuntimeError if a stage stopped because of errors, like the game loop did before the pipeline.
+        """
+        for stage in self.stages:
+            if stage.error is not None:
+                raise RuntimeError(f"Pipeline stage {stage.name} failed: {stage.error}") from stage.error
+
+    def get_result(self, timeout=1.0):
+        self.check_stages()
+        item = self.results_queue.get(timeout)
+        if item is None:
+            self.check_stages()
+        if item is not None:
+            self.latency_count += 1
+            self.total_latency += time.monotonic() - item["capture_time"]
+        return item
+
+    def get_composed_frame(self):
+        item = self.display_queue.get(0)
+        return item["composed_frame"] if item is not None else None
+
+    def get_stats(self):
+        stats = {stage.name: stage.get_stats() for stage in self.stages}
+        stats["results"] = {
+            "queue_depth": self.results_queue.depth(),
+            "queue_dropped": self.results_queue.dropped,
+            "avg_latency": self.total_latency / self.latency_count if self.latency_count > 0 else 0.0,
+        }
+        return stats
@@ -0,0 +1,78 @@
+import sys
+import time
+import json
+import numpy as np
+import parameters as param
+from replay_camera import ReplayCamera
+from hex_board_model import HexBoardModel
+from yolo_object_detector import YoloObjectDetector
+from ball_locator import BallLocator
+
+
+def summarize(name, samples):
+    if not samples:
+        return
+    samples = np.array(samples) * 1000
+    print(f"{name:<10} mean: {samples.mean():7.2f}ms  p50: {np.percentile(samples, 50):7.2f}ms  "
+          f"p95: {np.percentile(samples, 95):7.2f}ms  max: {samples.max():7.2f}ms")
+
+
+def benchmark_pipeline(source1, source2, calibration_file=param.CALIBRATION_FILE, mode="fast", num_frames=300):
+    """
+    Runs the capture -> ball detection -> hexagon lookup path of the game over two recordings and
+    prints throughput and per-stage latency. Use mode "fast" or "step" for reproducible numbers.
+    """
+    cameras = ReplayCamera(source1, source2, mode=mode, loop=False)
+    hex_model_cam1 = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(0, param.CAMERA_RESOLUTION[1]*2))
+    hex_model_cam2 = HexBoardModel(param.HEXAGONS_SVG_FILE, center_offset=param.HEXAGONS_SVG_OFFSET, cam_pos=(param.CAMERA_RESOLUTION[0]*2, param.CAMERA_RESOLUTION[1]*2))
+    with open(calibration_file, 'r') as f:
+        data = json.load(f)
+    hex_model_cam1.set_calibration_points(data["floor_quad1"])
+    hex_model_cam2.set_calibration_points(data["floor_quad2"])
+
+    ball_detector = YoloObjectDetector(class_id=param.YOLO_MODEL_BALL_ID, model_path=param.YOLO_MODEL_BALL)
+    ball_locator = BallLocator(hex_model_cam1, hex_model_cam2)
+
+    # warm up the model, the first inference is much slower
+    frame1, frame2 = cameras.get_frames()
+    ball_locator.locate(ball_detector, frame1, frame2)
+    cameras.rewind()
+
+    capture_times = []
+    locate_times = []
+    total_times = []
+    hexes = []
+    start_time = time.perf_counter()
+    try:
+        while len(total_times) < num_frames:
+            t0 = time.perf_counter()
+            frame1, frame2 = cameras.get_frames()
+            t1 = time.perf_counter()
+            location = ball_locator.locate(ball_detector, frame1, frame2)
+            t2 = time.perf_counter()
+
+            capture_times.append(t1 - t0)
+            locate_times.append(t2 - t1)
+            total_times.append(t2 - t0)
+            hexes.append(location.hex)
+    except RuntimeError:  # end of the replay
+        pass
+    elapsed = time.perf_counter() - start_time
+
+    cameras.release()
+
+    print(f"frames: {len(total_times)}, throughput: {len(total_times) / elapsed:.2f} fps")
+    summarize("capture", capture_times)
+    summarize("locate", locate_times)
+    summarize("total", total_times)
+    print(f"ball found on a hexagon in {sum(h is not None for h in hexes)} frames")
+
+    return hexes
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python pipeline_benchmark.py <video_or_dir_cam1> <video_or_dir_cam2> [num_frames]")
+        exit(1)
+
+    benchmark_pipeline(sys.argv[1], sys.argv[2], num_frames=int(sys.argv[3]) if len(sys.argv) > 3 else 300)
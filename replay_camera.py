@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+import parameters as param
+from dual_camera import DualCamera
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+TIMESTAMPS_SUFFIX = ".timestamps.txt"  # next to a video file, or "timestamps.txt" inside a frame directory
+
+
+class ReplayFrameSource:
+    """
+    Sequential reader of a recorded camera, either a video file or a directory of frames.
+
+    Each frame has a timestamp in seconds, relative to the first frame. Timestamps are read from a text
+    file with one value per line (see record_cameras) or derived from the frame rate.
+    """
+    def __init__(self, path, fps=30.0):
+        self.path = path
+        self.fps = fps
+        self.is_directory = os.path.isdir(path)
+        self.cap = None
+        self.files = []
+
+        if self.is_directory:
+            self.files = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+            self.num_frames = len(self.files)
+            timestamps_file = os.path.join(path, "timestamps.txt")
+        else:
+            self.cap = cv2.VideoCapture(path)
+            if not self.cap.isOpened():
+                raise RuntimeError(f"Replay video {path} could not be opened.")
+            self.num_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            video_fps = self.cap.get(cv2.CAP_PROP_FPS)
+            if video_fps > 0:
+                self.fps = video_fps
+            timestamps_file = path + TIMESTAMPS_SUFFIX
+
+        if self.num_frames == 0:
+            raise RuntimeError(f"Replay source {path} has no frames.")
+
+        self.timestamps = self.load_timestamps(timestamps_file, self.num_frames, self.fps)
+        self.index = -1  # index of the frame in self.frame
+        self.frame = None
+
+    @staticmethod
+    def load_timestamps(file_path, num_frames, fps):
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                timestamps = [float(line) for line in f if line.strip()]
+            if len(timestamps) >= num_frames:
+                timestamps = np.array(timestamps[:num_frames], dtype=np.float64)
+                return timestamps - timestamps[0]
+            logger.warning(f"{file_path} has fewer timestamps than frames, using {fps} fps")
+
+        return np.arange(num_frames, dtype=np.float64) / fps
+
+    def rewind(self):
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.index = -1
+        self.frame = None
+
+    def duration(self):
+        return self.timestamps[-1]
+
+    def frame_at(self, replay_time):
+        """
+        Returns the last frame captured at or before replay_time, like a live camera would.
+        """
+        target = int(np.searchsorted(self.timestamps, replay_time, side='right')) - 1
+        target = min(max(target, 0), self.num_frames - 1)
+
+        if target > self.index:
+            self.seek(target)
+
+        return self.frame
+
+    def seek(self, target):
+        if self.is_directory:
+            self.frame = cv2.imread(os.path.join(self.path, self.files[target]))
+        else:
+            # skipped frames are only grabbed, never decoded
+            while self.index < target - 1:
+                self.cap.grab()
+                self.index += 1
+            ret, frame = self.cap.read()
+            if not ret:
+                raise RuntimeError(f"Failed to read frame {target} from {self.path}.")
+            self.frame = frame
+
+        self.index = target
+
+    def release(self):
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+
+
+class ReplayCamera(DualCamera):
+    """
+    Drop-in replacement for DualCamera that plays two recordings instead of opening the cameras.
+
+    Playback modes:
+        realtime - frames follow the wall clock, skipping frames when the consumer is slow
+        fast     - every call returns the next frame, as fast as the consumer can take them
+        step     - every call advances the replay clock by a fixed step (reproducible runs)
+    """
+    MODES = ("realtime", "fast", "step")
+
+    def __init__(self, source1, source2, mode="realtime", step=1/30, loop=True):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid replay mode: {mode}")
+
+        self.mode = mode
+        self.step = step
+        self.loop = loop
+        self.exposures = {1: 0, 2: 0}
+
+        self.source1 = ReplayFrameSource(source1) if 1 in param.CAMERA_PRIORITY else None
+        self.source2 = ReplayFrameSource(source2) if 2 in param.CAMERA_PRIORITY else None
+        self.sources = [source for source in (self.source1, self.source2) if source is not None]
+
+        self.black_frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        self.reader1 = self.reader2 = None  # no capture threads
+        self.replay_time = 0.0
+        self.start_time = None
+        self.num_frames_served = 0
+
+    def set_exposure1(self, exposure, save=True):
+        self.exposures[1] = exposure
+
+    def set_exposure2(self, exposure, save=True):
+        self.exposures[2] = exposure
+
+    def get_exposure1(self):
+        return self.exposures[1]
+
+    def get_exposure2(self):
+        return self.exposures[2]
+
+    def rewind(self):
+        for source in self.sources:
+            source.rewind()
+        self.replay_time = 0.0
+        self.start_time = None
+
+    def advance_clock(self):
+        if self.mode == "realtime":
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+            self.replay_time = time.monotonic() - self.start_time
+
+        elif self.mode == "step":
+            if self.num_frames_served > 0:
+                self.replay_time += self.step
+
+        elif self.mode == "fast":
+            # jump to the next frame of whichever source has it first
+            next_times = [source.timestamps[source.index + 1] for source in self.sources
+                          if source.index + 1 < source.num_frames]
+            if next_times:
+                self.replay_time = max(self.replay_time, min(next_times))
+            else:
+                self.replay_time = max(source.duration() for source in self.sources) + self.step
+
+    def get_frames(self):
+        self.advance_clock()
+
+        if self.replay_time > max(source.duration() for source in self.sources):
+            if not self.loop:
+                raise RuntimeError("Replay finished.")
+            logger.debug("Replay restarted")
+            self.rewind()
+            self.advance_clock()
+
+        frame1 = self.source1.frame_at(self.replay_time).copy() if self.source1 is not None else self.black_frame
+        frame2 = self.source2.frame_at(self.replay_time).copy() if self.source2 is not None else self.black_frame
+        self.num_frames_served += 1
+
+        return frame1, frame2
+
+    def get_frames_after(self, timestamp, skip=1, timeout=2.0):
+        # the recordings don't change with the exposure or the LEDs, the next frames are as good as any
+        for _ in range(skip):
+            self.get_frames()
+        return self.get_frames()
+
+    def wait_new_frames(self, timeout=0.1):
+        if self.mode != "realtime" or self.start_time is None:
+            return
+
+        next_times = [source.timestamps[source.index + 1] for source in self.sources
+                      if source.index + 1 < source.num_frames]
+        if next_times:
+            wait_time = min(next_times) - (time.monotonic() - self.start_time)
+            if wait_time > 0:
+                time.sleep(min(wait_time, timeout))
+
+    def get_capture_stats(self):
+        stats = {}
+        for cam_id, source in ((1, self.source1), (2, self.source2)):
+            if source is not None:
+                stats[cam_id] = {
+                    "sequence": source.index,
+                    "frame_age": max(0.0, self.replay_time - source.timestamps[max(source.index, 0)]),
+                    "dropped_frames": 0,
+                    "read_failures": 0,
+                }
+        return stats
+
+    def release(self):
+        for source in self.sources:
+            source.release()
+        cv2.destroyAllWindows()
+
+
+def record_cameras(cameras, path1, path2, duration, fps=30.0):
+    """
+    Records both cameras to video files, with a timestamps file next to each one, to be used by ReplayCamera.
+    """
+    writers = {}
+    timestamps = {path1: [], path2: []}
+    start_time = time.monotonic()
+    while time.monotonic() - start_time < duration:
+        frames = cameras.get_frames()
+        timestamp = time.monotonic() - start_time
+        for path, frame in zip((path1, path2), frames):
+            if path not in writers:
+                height, width = frame.shape[:2]
+                writers[path] = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            writers[path].write(frame)
+            timestamps[path].append(timestamp)
+
+    for path, writer in writers.items():
+        writer.release()
+        with open(path + TIMESTAMPS_SUFFIX, 'w') as f:
+            f.writelines(f"{t:.6f}\n" for t in timestamps[path])
+
+
+def test_replay_get_frames_after(num_frames=10):
+    """
+    Plays a generated recording with get_frames_after, like the calibration does, in every mode.
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as path:
+        for i in range(num_frames):
+            cv2.imwrite(os.path.join(path, f"{i:04d}.png"), np.full((72, 128, 3), i, dtype=np.uint8))
+
+        for mode in ReplayCamera.MODES:
+            camera = ReplayCamera(path, path, mode=mode)
+            camera.set_exposure1(10, save=False)
+            frame1, frame2 = camera.get_frames_after(time.monotonic())
+            assert frame1.shape == (72, 128, 3) and frame2.shape == (72, 128, 3), f"{mode}: wrong frames"
+            for source in camera.sources:
+                source.release()
+            print(f"test_replay_get_frames_after {mode}: ok")
+
+
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] == "test":
+    test_replay_get_frames_after()
+
+elif __name__ == "__main__":
+    dual_cam = DualCamera(param.CAMERA1_ID, param.CAMERA2_ID, (1280, 720), (1280, 720))
+    try:
+        record_cameras(dual_cam, "replay_cam1.mp4", "replay_cam2.mp4", duration=30)
+    finally:
+        dual_cam.release()
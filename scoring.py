@@ -0,0 +1,26 @@
+import parameters as param
+
+
+def get_score_values():
+    """
+    Returns the scoring constants of parameters.py, the keys accepted by calculate_score.
+    """
+    return {
+        "time_score": param.TIME_SCORE,
+        "hex_correct_score": param.HEX_CORRECT_SCORE,
+        "hex_wrong_score": param.HEX_WRONG_SCORE,
+        "goal_score": param.GOAL_SCORE,
+    }
+
+
+def calculate_score(num_correct, num_wrong, goal, time_left, score_values=None):
+    """
+    Score of a game. The arguments can also be NumPy arrays, to score many simulated games at once.
+
+    :param score_values: Scoring constants (see get_score_values), None uses the ones of parameters.py.
+    """
+    values = score_values or get_score_values()
+    return time_left * values["time_score"] + \
+        num_correct * values["hex_correct_score"] + \
+        num_wrong * values["hex_wrong_score"] + \
+        goal * values["goal_score"]
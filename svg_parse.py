@@ -41,12 +41,10 @@ def parse_svg_to_polylines(svg_file, offset=(0.0, 0.0), sample_interval=100000.0
                 matrix = np.array([[a, c, e],
                                    [b, d, f],
                                    [0, 0, 1]])
-                transformed_points = []
-                for x, y in points:
-                    p = np.array([x, y, 1])
-                    p_trans = matrix @ p
-                    transformed_points.append((p_trans[0], p_trans[1]))
-                points = transformed_points
+                # all points of the path in one product
+                np_points = np.column_stack([np.array(points), np.ones(len(points))])
+                transformed = np_points @ matrix.T
+                points = [tuple(point) for point in transformed[:, :2].tolist()]
 
         polylines.append(points)
 
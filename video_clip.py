@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import cv2
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class VideoClip:
+    """
+    Video decoded once and resized to the panel size, so playing it is only indexing an array.
+
+    The frames are kept in one (num_frames, height, width, 3) uint8 array, either in RAM or memory-mapped
+    from a .npy cache next to the video (see load).
+    """
+    def __init__(self, frames, fps, name=""):
+        """
+        :param frames: (num_frames, height, width, 3) BGR frames.
+        :param fps: Frame rate of the video.
+        :param name: Name shown in the logs.
+        """
+        self.frames = frames
+        self.fps = fps
+        self.name = name
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get_frame(self, idx):
+        return self.frames[idx % len(self.frames)]
+
+    def is_memory_mapped(self):
+        return isinstance(self.frames, np.memmap)
+
+    def memory_size(self):
+        """
+        Bytes of the frames (for a memory-mapped clip, the most it can take from the page cache).
+        """
+        return self.frames.nbytes
+
+    @staticmethod
+    def decode(video_path, size):
+        """
+        Reads every frame of the video, resized to size (width, height).
+
+        :return: (frames, fps) or None if the video can't be opened.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return None
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        # the frame count of the container is only an estimate, the array grows if it is short
+        frames = np.empty((max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1), size[1], size[0], 3), dtype=np.uint8)
+        count = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if count == len(frames):
+                frames = np.concatenate([frames, np.empty_like(frames)])
+            cv2.resize(frame, size, dst=frames[count])
+            count += 1
+        cap.release()
+
+        if count == 0:
+            return None
+        return frames[:count], fps
+
+    @staticmethod
+    def load(video_path, size, use_cache=True):
+        """
+        Decodes the video, or with use_cache memory-maps the frames from <video_path>.<width>x<height>.npy,
+        writing that file (and a .json with its source) when it doesn't exist or the video changed.
+
+        :return: The clip or None if the video can't be read.
+        """
+        name = os.path.basename(video_path)
+        if not use_cache:
+            decoded = VideoClip.decode(video_path, size)
+            return VideoClip(*decoded, name) if decoded is not None else None
+
+        cache_file = f"{video_path}.{size[0]}x{size[1]}.npy"
+        info_file = cache_file + ".json"
+        try:
+            with open(video_path, 'rb') as f:
+                video_hash = hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            logger.error(f"Failed to read the video {video_path}: {e}")
+            return None
+
+        try:
+            with open(info_file, 'r') as f:
+                info = json.load(f)
+            if info.get("hash") == video_hash:
+                return VideoClip(np.load(cache_file, mmap_mode='r'), info["fps"], name)
+            logger.info(f"{cache_file} is stale, rebuilding it")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to load {cache_file}: {e}")
+
+        decoded = VideoClip.decode(video_path, size)
+        if decoded is None:
+            return None
+        frames, fps = decoded
+        try:
+            np.save(cache_file, frames)
+            with open(info_file, 'w') as f:
+                json.dump({"hash": video_hash, "fps": fps}, f)
+        except OSError as e:
+            logger.warning(f"Failed to write {cache_file}: {e}")
+            return VideoClip(frames, fps, name)
+
+        # the decoded copy is dropped, the frames are paged in from the file as they are played
+        del frames
+        return VideoClip(np.load(cache_file, mmap_mode='r'), fps, name)
+
+
+class FramePacer:
+    """
+    Paces a clip on the monotonic clock at its frame rate: the frame to show is the one due at the
+    current time since the clip started, so a late frame makes the next ones be skipped (dropped)
+    and an early wake up keeps the frame on screen (repeated) instead of playing the clip faster.
+    """
+    def __init__(self):
+        self.fps = 30.0
+        self.start_time = 0.0
+        self.last_index = -1
+        self.frame_time = 0.0  # when the frame being rendered was due
+
+        self.frames_rendered = 0
+        self.dropped_frames = 0
+        self.repeated_frames = 0
+        self.total_render_time = 0.0
+        self.max_render_time = 0.0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def start(self, fps, now):
+        self.fps = fps
+        self.start_time = now
+        self.last_index = -1
+
+    def begin_frame(self, now):
+        """
+        Returns (index, skipped) of the frame due now, skipped being the frames dropped since the last
+        one, or None if the last frame is still the current one.
+        """
+        # the epsilon keeps a wake up right on time from being taken as the previous frame
+        index = int((now - self.start_time) * self.fps + 1e-6)
+        if index <= self.last_index:
+            self.repeated_frames += 1
+            return None
+
+        skipped = index - self.last_index - 1
+        self.dropped_frames += skipped
+        self.last_index = index
+        self.frame_time = self.start_time + index / self.fps
+        return index, skipped
+
+    def end_frame(self, render_time, now):
+        lateness = now - self.frame_time
+        self.frames_rendered += 1
+        self.total_render_time += render_time
+        self.max_render_time = max(self.max_render_time, render_time)
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+
+    def get_wait_time(self, now):
+        """
+        Seconds until the next frame is due.
+        """
+        return max(self.start_time + (self.last_index + 1) / self.fps - now, 0.0)
+
+    def get_stats(self):
+        frames = max(self.frames_rendered, 1)
+        return {
+            "frames_rendered": self.frames_rendered,
+            "dropped_frames": self.dropped_frames,
+            "repeated_frames": self.repeated_frames,
+            "avg_render_time": self.total_render_time / frames,
+            "max_render_time": self.max_render_time,
+            "avg_lateness": self.total_lateness / frames,
+            "max_lateness": self.max_lateness,
+        }
+
+
+def benchmark_playback(video_path, size=(1536, 256), num_frames=300):
+    """
+    Compares the time per frame of decoding and resizing the video on every frame (like the panel did)
+    with indexing the preloaded clip, in RAM and memory-mapped.
+    """
+    cap = cv2.VideoCapture(video_path)
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        cv2.resize(frame, size)
+    print(f"decode + resize: {(time.perf_counter() - start) / num_frames * 1000:.2f}ms/frame")
+    cap.release()
+
+    for use_cache in (False, True):
+        start = time.perf_counter()
+        clip = VideoClip.load(video_path, size, use_cache)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        checksum = 0
+        for idx in range(num_frames):
+            # touches the frame, like imshow would
+            checksum += int(clip.get_frame(idx)[0, 0, 0])
+        print(f"{'memory-mapped' if use_cache else 'in RAM':<13}: load {load_time:.2f}s, "
+              f"{(time.perf_counter() - start) / num_frames * 1000:.3f}ms/frame, {len(clip)} frames, "
+              f"{clip.memory_size() / 2 ** 20:.1f}MB")
+
+
+if __name__ == "__main__":
+    import parameters as param
+
+    benchmark_playback(sys.argv[1] if len(sys.argv) > 1 else param.GAME_VIDEO)
@@ -1,19 +1,105 @@
-from ultralytics import YOLO
+import sys
 import cv2
 import numpy as np
+import parameters as param
+from inference_backends import get_backend
+
+
+class TrackingWindow:
+    """
+    Search window centred on the last detection of an object.
+
+    The window grows on every miss and, after max_misses misses in a row, the tracking is lost and
+    the next search is done on the whole region again.
+    """
+    def __init__(self, size, growth=1.5, max_misses=3):
+        self.size = size
+        self.growth = growth
+        self.max_misses = max_misses
+        self.center = None
+        self.box_size = (0, 0)
+        self.misses = 0
+
+        self.hits = 0
+        self.total_misses = 0
+        self.fallbacks = 0
+        self.full_searches = 0
+
+    def reset(self):
+        self.center = None
+        self.misses = 0
+
+    def get_roi(self):
+        """
+        :return: (x1, y1, x2, y2) window to search or None to search the whole region.
+        """
+        if self.center is None:
+            return None
+
+        scale = self.growth ** self.misses
+        # keep room for a few ball sizes of movement between frames
+        width = max(self.size[0], self.box_size[0] * 4) * scale
+        height = max(self.size[1], self.box_size[1] * 4) * scale
+        cx, cy = self.center
+        return cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2
+
+    def update(self, box, windowed):
+        if box is not None:
+            x1, y1, x2, y2 = box
+            self.center = ((x1 + x2) / 2, (y1 + y2) / 2)
+            self.box_size = (x2 - x1, y2 - y1)
+            self.misses = 0
+            if windowed:
+                self.hits += 1
+            else:
+                self.full_searches += 1
+        elif windowed:
+            self.misses += 1
+            self.total_misses += 1
+            if self.misses >= self.max_misses:
+                self.fallbacks += 1
+                self.reset()
+        else:
+            self.full_searches += 1
+
+    def get_stats(self):
+        windowed = self.hits + self.total_misses
+        return {
+            "hits": self.hits,
+            "misses": self.total_misses,
+            "fallbacks": self.fallbacks,
+            "full_searches": self.full_searches,
+            "hit_rate": self.hits / windowed if windowed > 0 else 0.0,
+        }
+
+    @staticmethod
+    def intersect(window, roi):
+        if roi is None:
+            return window
+
+        x1, y1, x2, y2 = window
+        rx1, ry1, rx2, ry2 = roi
+        return max(x1, rx1), max(y1, ry1), min(x2, rx2), min(y2, ry2)
 
 
 class YoloObjectDetector:
-    def __init__(self, class_id: int, model_path: str):
+    def __init__(self, class_id: int, model_path: str, backend=None, int8=None):
         """
         Initialize the detector with a class ID and YOLO model.
 
         :param class_id: The class ID to detect (e.g., 0 for person).
         :param model_path: Path to the YOLO model file.
+        :param backend: Inference backend (torch, onnx, openvino or opencv), defaults to param.YOLO_BACKEND.
+                        The model is exported on first use for backends other than torch.
+        :param int8: Use INT8 quantized weights, defaults to param.YOLO_INT8. The OpenVINO export is
+                     calibrated on param.INFERENCE_INT8_DATA.
         """
         self.class_id = class_id
-        self.model = YOLO(model_path)
+        self.backend = get_backend(backend if backend is not None else param.YOLO_BACKEND)
+        self.model = self.backend.load(model_path, bool(param.YOLO_INT8 if int8 is None else int8),
+                                       data=param.INFERENCE_INT8_DATA)
         self.last_results = None
+        self.tracking_windows = {}
 
     def get_last_results(self):
         return self.last_results
@@ -25,14 +111,12 @@ class YoloObjectDetector:
         :param frame: Image frame as a numpy array (e.g., from OpenCV).
         :return: List of bounding boxes [x1, y1, x2, y2] for detected objects.
         """
-        self.last_results = self.model(frame)
+        self.last_results = self.model(frame, **self.predict_args())
         boxes = []
 
         for result in self.last_results:
-            for box in result.boxes:
-                if int(box.cls[0]) == self.class_id:
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    boxes.append([x1, y1, x2, y2])
+            mask = result.boxes.cls == self.class_id
+            boxes.extend(result.boxes.xyxy[mask].tolist())
 
         return boxes
 
@@ -43,17 +127,14 @@ class YoloObjectDetector:
         :param frame: Image frame as a numpy array (e.g., from OpenCV).
         :return: List of bounding boxes [x1, y1, x2, y2] for detected objects.
         """
-        self.last_results = []
-
-        self.last_results = self.model.track(frame)
+        self.last_results = self.model.track(frame, **self.predict_args())
+        boxes = []
 
         for result in self.last_results:
-            for box in result.boxes:
-                if int(box.cls[0]) == self.class_id:
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    self.last_results.append([x1, y1, x2, y2])
+            mask = result.boxes.cls == self.class_id
+            boxes.extend(result.boxes.xyxy[mask].tolist())
 
-        return self.last_results
+        return boxes
 
     def track_best(self, frame: np.ndarray):
         """
@@ -64,43 +145,187 @@ class YoloObjectDetector:
         """
         best_box = None
         best_conf = -1
-        best_area = -1
 
-        self.last_results = self.model.track(frame)
+        self.last_results = self.model.track(frame, **self.predict_args())
 
         for result in self.last_results:
-            for box in result.boxes:
-                conf = float(box.conf)
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                area = (x2 - x1) * (y2 - y1)
-                if (conf > best_conf) or (conf == best_conf and area > best_area):
-                    best_box = [x1, y1, x2, y2]
-                    best_conf = conf
-                    best_area = area
+            # any class is accepted here
+            box, conf = self.best_box(result.boxes.xyxy, result.boxes.conf)
+            if conf > best_conf:
+                best_box = box
+                best_conf = conf
 
         return best_box
 
-    def detect_best(self, frame, min_conf=0.0):
-        self.last_results = self.model.predict(frame, conf=min_conf)
+    def detect_best(self, frame, min_conf=0.0, roi=None, imgsz=None):
+        """
+        Detect the object of the specified class_id with the highest confidence in the given frame.
+
+        :param frame: Image frame as a numpy array (e.g., from OpenCV).
+        :param min_conf: Minimum confidence level to accept a detection as valid (0.0 to 1.0).
+        :param roi: Optional (x1, y1, x2, y2) region of the frame to search, the rest of the frame is ignored.
+        :param imgsz: Optional model input size, smaller sizes are faster.
+        :return: (best_box, best_conf) in full frame coordinates, best_box is None if nothing was found.
+        """
+        frame, offset = self.crop_roi(frame, roi)
+        self.last_results = self.model.predict(frame, conf=min_conf, **self.predict_args(imgsz))
         best_box = None
         best_conf = -1
-        best_area = -1
 
         for result in self.last_results:
-            for box in result.boxes:
-                if int(box.cls) == self.class_id:
-                    conf = float(box.conf)
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    area = (x2 - x1) * (y2 - y1)
-                    if (conf > best_conf) or (conf == best_conf and area > best_area):
-                        best_box = [x1, y1, x2, y2]
-                        best_conf = conf
-                        best_area = area
+            box, conf = self.select_best_box(result)
+            if conf > best_conf:
+                best_box = box
+                best_conf = conf
 
         #if best_conf < min_conf:
         #    return None
 
-        return best_box, best_conf
+        return self.offset_box(best_box, offset), best_conf
+
+    def detect_best_batch(self, frames, min_conf=0.0, rois=None, imgsz=None):
+        """
+        Detect the best object of the specified class_id in each frame, running all frames through the model
+        in a single batched call.
+
+        :param frames: List of image frames as numpy arrays (e.g., one per camera).
+        :param min_conf: Minimum confidence level to accept a detection as valid (0.0 to 1.0).
+        :param rois: Optional list with one (x1, y1, x2, y2) region (or None for the full frame) per frame.
+        :param imgsz: Optional model input size, smaller sizes are faster.
+        :return: List with one (best_box, best_conf) tuple per frame, best_box is None if nothing was found.
+        """
+        rois = rois if rois is not None else [None] * len(frames)
+        crops, offsets = zip(*[self.crop_roi(frame, roi) for frame, roi in zip(frames, rois)])
+        if self.backend.dynamic:
+            self.last_results = self.model.predict(list(crops), conf=min_conf, **self.predict_args(imgsz))
+        else:
+            # static shape models only take one frame at a time
+            self.last_results = [self.model.predict(crop, conf=min_conf, **self.predict_args())[0] for crop in crops]
+
+        detections = []
+        for result, offset in zip(self.last_results, offsets):
+            box, conf = self.select_best_box(result)
+            detections.append((self.offset_box(box, offset), conf))
+
+        return detections
+
+    def detect_best_tracked(self, frames, keys, min_conf=0.0, rois=None, imgsz=None):
+        """
+        Same as detect_best_batch, but each frame is searched only in a small window around the last
+        detection of the same source (see TrackingWindow).
+
+        :param frames: List of image frames as numpy arrays (e.g., one per camera).
+        :param keys: List with one key per frame identifying its source (e.g., the camera id).
+        :param min_conf: Minimum confidence level to accept a detection as valid (0.0 to 1.0).
+        :param rois: Optional list with the region to search (or None) per frame when not tracking.
+        :param imgsz: Optional model input size when not tracking.
+        :return: List with one (best_box, best_conf) tuple per frame, best_box is None if nothing was found.
+        """
+        rois = rois if rois is not None else [None] * len(frames)
+        windows = [self.get_tracking_window(key) for key in keys]
+
+        search_rois = []
+        windowed = []
+        for window, roi in zip(windows, rois):
+            window_roi = window.get_roi()
+            windowed.append(window_roi is not None)
+            search_rois.append(roi if window_roi is None else TrackingWindow.intersect(window_roi, roi))
+
+        # the small input size only pays off when every frame is searched in a window
+        search_imgsz = param.TRACKING_WINDOW_IMGSZ if all(windowed) else imgsz
+        detections = self.detect_best_batch(frames, min_conf, search_rois, search_imgsz)
+
+        for window, (box, _), is_windowed in zip(windows, detections, windowed):
+            window.update(box, is_windowed)
+
+        return detections
+
+    def get_tracking_window(self, key):
+        if key not in self.tracking_windows:
+            self.tracking_windows[key] = TrackingWindow(param.TRACKING_WINDOW_SIZE,
+                                                        param.TRACKING_WINDOW_GROWTH,
+                                                        param.TRACKING_MAX_MISSES)
+        return self.tracking_windows[key]
+
+    def reset_tracking(self):
+        for window in self.tracking_windows.values():
+            window.reset()
+
+    def get_tracking_stats(self):
+        return {key: window.get_stats() for key, window in self.tracking_windows.items()}
+
+    def predict_args(self, imgsz=None):
+        args = self.backend.predict_args()
+        # static shape models always run at their export size
+        if imgsz and self.backend.dynamic:
+            args["imgsz"] = imgsz
+        return args
+
+    @staticmethod
+    def crop_roi(frame, roi):
+        """
+        Crop the frame to the region of interest.
+
+        :return: (cropped frame, (x, y) offset of the crop in the frame).
+        """
+        if roi is None:
+            return frame, (0, 0)
+
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = roi
+        x1, x2 = max(0, int(x1)), min(width, int(x2))
+        y1, y2 = max(0, int(y1)), min(height, int(y2))
+        if x2 <= x1 or y2 <= y1:
+            return frame, (0, 0)
+
+        return np.ascontiguousarray(frame[y1:y2, x1:x2]), (x1, y1)
+
+    @staticmethod
+    def offset_box(box, offset):
+        if box is None or offset == (0, 0):
+            return box
+
+        x, y = offset
+        x1, y1, x2, y2 = box
+        return [x1 + x, y1 + y, x2 + x, y2 + y]
+
+    def select_best_box(self, result):
+        """
+        Select the box of the specified class_id with the highest confidence (largest area on ties).
+
+        :param result: A single YOLO result (one frame).
+        :return: (best_box, best_conf), best_box is None and best_conf is -1 if there is no such box.
+        """
+        return self.best_box(result.boxes.xyxy, result.boxes.conf, result.boxes.cls, self.class_id)
+
+    @staticmethod
+    def best_box(xyxy, conf, cls=None, class_id=None):
+        """
+        Select the box with the highest confidence (largest area on ties) working on whole tensors, so only
+        the winning row is transferred from the device. Works with torch tensors and numpy arrays.
+
+        :param xyxy: (N, 4) boxes [x1, y1, x2, y2].
+        :param conf: (N,) confidences.
+        :param cls: (N,) class ids, only needed to filter by class_id.
+        :param class_id: Only boxes of this class are accepted, None accepts any class.
+        :return: (best_box, best_conf), best_box is None and best_conf is -1 if there is no such box.
+        """
+        if len(conf) == 0:
+            return None, -1
+
+        if class_id is not None:
+            valid = cls == class_id
+            conf = conf * valid - 2.0 * ~valid  # boxes of other classes can never win
+
+        ties = conf == conf.max()
+        area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+        idx = int((area * ties - 1.0 * ~ties).argmax())
+
+        best_conf = float(conf[idx])
+        if best_conf < 0:
+            return None, -1
+
+        return xyxy[idx].tolist(), best_conf
 
     def detect_avg_confidence(self, frame: np.ndarray, min_conf=0.0):
         """
@@ -110,26 +335,77 @@ class YoloObjectDetector:
         :param min_conf: Minimum confidence level to accept a detection as valid (0.0 to 1.0) .
         :return: List of bounding boxes [x1, y1, x2, y2] for detected objects.
         """
-        self.last_results = self.model(frame, conf=min_conf)
+        self.last_results = self.model(frame, conf=min_conf, **self.predict_args())
         boxes = []
 
         sum_conf = 0
         for result in self.last_results:
-            for box in result.boxes:
-                if int(box.cls[0]) == self.class_id:
-                    conf = float(box.conf)
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    sum_conf += conf
-                    boxes.append([x1, y1, x2, y2])
+            mask = result.boxes.cls == self.class_id
+            boxes.extend(result.boxes.xyxy[mask].tolist())
+            sum_conf += float(result.boxes.conf[mask].sum())
 
         avg_conf = sum_conf / len(boxes) if len(boxes) > 0 else 0
 
         return boxes, avg_conf
 
 
-if __name__ == "__main__":
-    import parameters as param
-
+def select_best_box_loop(result, class_id):
+    # per-box implementation used before the vectorized one, kept as the reference of the benchmark
+    best_box = None
+    best_conf = -1
+    best_area = -1
+
+    for box in result.boxes:
+        if int(box.cls) == class_id:
+            conf = float(box.conf)
+            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+            area = (x2 - x1) * (y2 - y1)
+            if (conf > best_conf) or (conf == best_conf and area > best_area):
+                best_box = [x1, y1, x2, y2]
+                best_conf = conf
+                best_area = area
+
+    return best_box, best_conf
+
+
+def benchmark_post_processing(num_calls=1000):
+    """
+    Compares the cost per call of selecting the best box with the per-box loop and the vectorized path.
+    """
+    import time
+    import torch
+    from types import SimpleNamespace
+    from ultralytics.engine.results import Boxes
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    generator = torch.Generator().manual_seed(0)
+    for num_boxes in [1, 10, 100]:
+        xy = torch.rand((num_boxes, 2), generator=generator) * 1000
+        wh = torch.rand((num_boxes, 2), generator=generator) * 100 + 1
+        conf = torch.rand((num_boxes, 1), generator=generator)
+        cls = torch.randint(0, 2, (num_boxes, 1), generator=generator).float()
+        data = torch.cat([xy, xy + wh, conf, cls], dim=1).to(device)
+        result = SimpleNamespace(boxes=Boxes(data, orig_shape=(720, 1280)))
+
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            loop_box, loop_conf = select_best_box_loop(result, 0)
+        loop_time = (time.perf_counter() - start) / num_calls
+
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            box, best_conf = YoloObjectDetector.best_box(result.boxes.xyxy, result.boxes.conf, result.boxes.cls, 0)
+        vectorized_time = (time.perf_counter() - start) / num_calls
+
+        assert (box is None and loop_box is None) or np.allclose(box, loop_box)
+        print(f"{num_boxes:3d} boxes ({device}): loop {loop_time * 1e6:8.1f}us, "
+              f"vectorized {vectorized_time * 1e6:8.1f}us")
+
+
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] == "bench":
+    benchmark_post_processing()
+
+elif __name__ == "__main__":
     model = param.YOLO_MODEL_HEXAGON
     image_path = r"images\img_calibration_01.jpg"
     detector = YoloObjectDetector(class_id=0, model_path=model)